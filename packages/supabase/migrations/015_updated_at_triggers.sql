@@ -0,0 +1,31 @@
+-- UPDATE 時に updated_at を自動更新するトリガー
+-- パイプラインの UPSERT は updated_at を送らないため、DEFAULT now() だけでは
+-- 更新された行の updated_at が挿入時刻のまま残る。
+-- migrate_cloud_to_local.py --incremental は updated_at を差分判定に使う。
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS trigger AS $$
+BEGIN
+  NEW.updated_at := now();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS set_updated_at ON areas;
+CREATE TRIGGER set_updated_at
+  BEFORE UPDATE ON areas
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS set_updated_at ON safety_scores;
+CREATE TRIGGER set_updated_at
+  BEFORE UPDATE ON safety_scores
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS set_updated_at ON area_vibe_data;
+CREATE TRIGGER set_updated_at
+  BEFORE UPDATE ON area_vibe_data
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS set_updated_at ON hazard_data;
+CREATE TRIGGER set_updated_at
+  BEFORE UPDATE ON hazard_data
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
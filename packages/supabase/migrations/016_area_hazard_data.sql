@@ -0,0 +1,29 @@
+-- ===== 丁目ごとの災害リスクテーブル =====
+-- 03_fetch_hazard.py --target areas が丁目の境界ポリゴンと災害区域の交差から算出する。
+-- カラムは hazard_data と同じ（station_id の代わりに area_name）。
+CREATE TABLE IF NOT EXISTS area_hazard_data (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  area_name TEXT NOT NULL REFERENCES areas(area_name) ON DELETE CASCADE UNIQUE,
+  flood_level TEXT NOT NULL DEFAULT 'none' CHECK (flood_level IN ('none','low','moderate','high','extreme')),
+  flood_depth_max FLOAT,
+  landslide_warning BOOLEAN NOT NULL DEFAULT false,
+  landslide_special BOOLEAN NOT NULL DEFAULT false,
+  tsunami_level TEXT NOT NULL DEFAULT 'none' CHECK (tsunami_level IN ('none','low','moderate','high','extreme')),
+  tsunami_depth_max FLOAT,
+  liquefaction_risk TEXT NOT NULL DEFAULT 'low' CHECK (liquefaction_risk IN ('low','moderate','high')),
+  score FLOAT NOT NULL DEFAULT 0,
+  rank INT,
+  flood_score FLOAT NOT NULL DEFAULT 25,
+  landslide_score FLOAT NOT NULL DEFAULT 25,
+  tsunami_score FLOAT NOT NULL DEFAULT 25,
+  liquefaction_score FLOAT NOT NULL DEFAULT 25,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+ALTER TABLE area_hazard_data ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "area_hazard_public_read" ON area_hazard_data FOR SELECT USING (true);
+
+DROP TRIGGER IF EXISTS set_updated_at ON area_hazard_data;
+CREATE TRIGGER set_updated_at
+  BEFORE UPDATE ON area_hazard_data
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
@@ -72,6 +72,31 @@ export interface Database {
         };
         Update: Partial<Database['public']['Tables']['hazard_data']['Insert']>;
       };
+      area_hazard_data: {
+        Row: {
+          id: string;
+          area_name: string;
+          flood_level: string;
+          flood_depth_max: number | null;
+          landslide_warning: boolean;
+          landslide_special: boolean;
+          tsunami_level: string;
+          tsunami_depth_max: number | null;
+          liquefaction_risk: string;
+          score: number;
+          rank: number | null;
+          flood_score: number;
+          landslide_score: number;
+          tsunami_score: number;
+          liquefaction_score: number;
+          updated_at: string;
+        };
+        Insert: Omit<Database['public']['Tables']['area_hazard_data']['Row'], 'id' | 'updated_at'> & {
+          id?: string;
+          updated_at?: string;
+        };
+        Update: Partial<Database['public']['Tables']['area_hazard_data']['Insert']>;
+      };
       area_vibe_data: {
         Row: {
           id: string;
@@ -13,8 +13,13 @@ load_dotenv(os.path.join(os.path.dirname(__file__), '..', '..', '.env'))
 SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
 
+# Supabase HTTP 接続プールの最大接続数
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE") or "10")
+
 # e-Stat API（政府統計の総合窓口）
 ESTAT_API_KEY = os.getenv("ESTAT_API_KEY", "")
+# e-Stat API の同時リクエスト数（データセット・ページの並列取得全体で共有）
+ESTAT_CONCURRENCY = int(os.getenv("ESTAT_CONCURRENCY") or "4")
 
 # 不動産情報ライブラリ API
 REINFOLIB_API_KEY = os.getenv("REINFOLIB_API_KEY", "")
@@ -22,6 +27,20 @@ REINFOLIB_API_KEY = os.getenv("REINFOLIB_API_KEY", "")
 # データ保存先ディレクトリ
 DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
 
+# 不動産情報ライブラリのタイルキャッシュ（data/cache/reinfolib_tiles）
+# 有効期間（日）とディスク使用量の上限（MB）
+REINFOLIB_TILE_CACHE_TTL_DAYS = float(os.getenv("REINFOLIB_TILE_CACHE_TTL_DAYS") or "30")
+REINFOLIB_TILE_CACHE_MAX_MB = int(os.getenv("REINFOLIB_TILE_CACHE_MAX_MB") or "2048")
+
+# 不動産情報ライブラリ API のレート制限（全エンドポイント共通）と同時リクエスト数
+REINFOLIB_REQUESTS_PER_SEC = float(os.getenv("REINFOLIB_REQUESTS_PER_SEC") or "2")
+REINFOLIB_CONCURRENCY = int(os.getenv("REINFOLIB_CONCURRENCY") or "4")
+
+# Overpass API で取得した施設データのキャッシュ（data/cache/overpass）
+# 有効期間（日）とディスク使用量の上限（MB）
+OVERPASS_CACHE_TTL_DAYS = float(os.getenv("OVERPASS_CACHE_TTL_DAYS") or "14")
+OVERPASS_CACHE_MAX_MB = int(os.getenv("OVERPASS_CACHE_MAX_MB") or "512")
+
 # 東京都の都道府県コード
 TOKYO_PREFECTURE_CODE = "13"
 
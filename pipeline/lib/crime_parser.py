@@ -1,6 +1,9 @@
 """
 犯罪データパーサー
 警視庁CSVのパース、町丁目名の正規化、境界Shapefileの読み込み
+
+parse_crime_csv は 1 行ずつ処理する基準実装、parse_crime_csv_columnar は
+pandas で列ごとに処理する高速版（結果は同一）。
 """
 
 import csv
@@ -10,6 +13,8 @@ from pathlib import Path
 from typing import Any, Optional
 
 import geopandas as gpd
+import numpy as np
+import pandas as pd
 from shapely.geometry import mapping, shape
 from shapely.ops import unary_union
 
@@ -20,15 +25,27 @@ logger = logging.getLogger(__name__)
 # 市区町村名の逆引き（名前→コード）
 _MUNI_NAME_TO_CODE: dict[str, str] = {v: k for k, v in TOKYO_MUNICIPALITIES.items()}
 
+# 市区町村名の先頭一致パターン。長い名前を先に並べる
+# （"あきる野市" が "市" だけの部分一致にならないよう）
+_MUNI_PREFIX = re.compile(
+    "^("
+    + "|".join(re.escape(name) for name in sorted(_MUNI_NAME_TO_CODE, key=len, reverse=True))
+    + ")"
+)
+
 # 全角数字→半角
 _FULLWIDTH_MAP = str.maketrans("０１２３４５６７８９", "0123456789")
 
 # 漢数字→算用数字
 _KANJI_NUM = {"一": "1", "二": "2", "三": "3", "四": "4", "五": "5",
               "六": "6", "七": "7", "八": "8", "九": "9"}
+_KANJI_CHOME = re.compile(r"([一二三四五六七八九])丁目")
+
+# 郡名
+_GUN_PREFIX = re.compile(r"^.+?郡")
 
 # 集計行として除外するパターン
-_SKIP_PATTERNS = re.compile(r"(計$|^合計|^総計|^海外|^不明|以下不詳)")
+_SKIP_PATTERNS = re.compile(r"(?:計$|^合計|^総計|^海外|^不明|以下不詳)")
 
 # 公園パターン（丁目を含むものは除外しない）
 _PARK_PATTERN = re.compile(r"^(?!.*丁目).*公園$")
@@ -40,6 +57,9 @@ _COL = {
     "fraud": 33, "intellectual": 35,
 }
 
+# 正規化済みの町丁目名（元の名前 → 正規化名）。年をまたいで同じ名前が繰り返し出るので使い回す
+_normalized_names: dict[str, str] = {}
+
 
 def normalize_area_name(name: str) -> str:
     """
@@ -53,18 +73,35 @@ def normalize_area_name(name: str) -> str:
     # 全角数字
     name = name.translate(_FULLWIDTH_MAP)
     # 漢数字（丁目の前）
-    name = re.sub(
-        r"([一二三四五六七八九])丁目",
-        lambda m: _KANJI_NUM[m.group(1)] + "丁目",
-        name,
-    )
+    name = _KANJI_CHOME.sub(lambda m: _KANJI_NUM[m.group(1)] + "丁目", name)
     # 郡名除去
-    name = re.sub(r"^.+?郡", "", name)
+    name = _GUN_PREFIX.sub("", name)
     # 大字除去
     name = name.replace("大字", "")
     return name
 
 
+def _normalize_area_names(names: pd.Series) -> pd.Series:
+    """
+    normalize_area_name の列版。
+
+    ユニークな名前のうち未処理のものだけに列単位の文字列演算をかけ、
+    結果を _normalized_names に覚えておく。
+    """
+    codes, uniques = pd.factorize(names)
+    new = pd.Series([n for n in uniques if n not in _normalized_names], dtype=object)
+    if len(new):
+        normalized = (
+            new.str.translate(_FULLWIDTH_MAP)
+            .str.replace(_KANJI_CHOME, lambda m: _KANJI_NUM[m.group(1)] + "丁目", regex=True)
+            .str.replace(_GUN_PREFIX, "", regex=True)
+            .str.replace("大字", "", regex=False)
+        )
+        _normalized_names.update(zip(new.tolist(), normalized.tolist()))
+    lookup = np.array([_normalized_names[n] for n in uniques], dtype=object)
+    return pd.Series(lookup[codes], index=names.index)
+
+
 def extract_municipality(area_name: str) -> Optional[tuple[str, str]]:
     """
     正規化済みエリア名から市区町村コードと名前を抽出。
@@ -73,11 +110,10 @@ def extract_municipality(area_name: str) -> Optional[tuple[str, str]]:
     Returns:
         (code, name) or None
     """
-    # 長い名前を先に試す（"あきる野市" が "市" だけの部分一致にならないよう）
-    for name in sorted(_MUNI_NAME_TO_CODE.keys(), key=len, reverse=True):
-        if area_name.startswith(name):
-            return _MUNI_NAME_TO_CODE[name], name
-    return None
+    m = _MUNI_PREFIX.match(area_name)
+    if m is None:
+        return None
+    return _MUNI_NAME_TO_CODE[m.group(1)], m.group(1)
 
 
 def _detect_encoding(csv_path: str) -> str:
@@ -158,6 +194,84 @@ def parse_crime_csv(csv_path: str, year: int) -> list[dict[str, Any]]:
     return records
 
 
+def _int_column(values: pd.Series) -> np.ndarray:
+    """件数列を int 配列に変換（空欄は 0、変換はユニークな値ごとに 1 回）"""
+    codes, uniques = pd.factorize(values)
+    converted = np.array([int(v or 0) for v in uniques], dtype=np.int64)
+    return converted[codes]
+
+
+def parse_crime_csv_columnar(csv_path: str, year: int) -> list[dict[str, Any]]:
+    """
+    parse_crime_csv の列処理版（結果のレコードは同一）。
+
+    CSV は使う列だけを pandas で文字列として読み、名前の正規化・集計行の判定・
+    市区町村の先頭一致（_MUNI_PREFIX）を列単位の文字列演算で行う。
+    """
+    encoding = _detect_encoding(csv_path)
+    logger.info("犯罪CSV パース中: %s (year=%d, encoding=%s)", csv_path, year, encoding)
+
+    # "other" 列は使わない（その他は総数から他の罪種を引いて求める）
+    count_keys = [k for k in _COL if k not in ("area", "other")]
+    usecols = sorted({_COL["area"], *(_COL[k] for k in count_keys)})
+    df = pd.read_csv(
+        csv_path, encoding=encoding, usecols=usecols, dtype=object, na_filter=False
+    )
+    logger.info("CSV行数: %d, ヘッダー先頭: %s", len(df), df.columns[0])
+    df.columns = usecols  # 列名を元の CSV の列インデックスにする
+
+    normalized = _normalize_area_names(df[_COL["area"]])
+    muni_name = normalized.str.extract(_MUNI_PREFIX, expand=False)
+
+    keep = (
+        # 集計行・公園名（丁目を含むものは除外しない）をスキップ
+        ~normalized.str.contains(_SKIP_PATTERNS)
+        & ~normalized.str.contains(_PARK_PATTERN)
+        # 市区町村が特定できない行と、市区町村名のみの行（合計行）をスキップ
+        & muni_name.notna()
+        & (normalized != muni_name)
+    ).to_numpy()
+    skipped = int((~keep).sum())
+
+    rows = df[keep]
+    column = {key: _int_column(rows[_COL[key]]) for key in count_keys}
+    total = column["total"]
+    violent = column["violent"]
+    assault = column["assault"]
+    theft = column["burglary"] + column["larceny"]
+    intellectual = column["fraud"] + column["intellectual"]
+    other = np.maximum(total - violent - assault - theft - intellectual, 0)
+
+    names = muni_name[keep].tolist()
+    records = [
+        {
+            "area_name": area_name,
+            "municipality_code": _MUNI_NAME_TO_CODE[name],
+            "municipality_name": name,
+            "year": year,
+            "total_crimes": t,
+            "crimes_violent": v,
+            "crimes_assault": a,
+            "crimes_theft": th,
+            "crimes_intellectual": i,
+            "crimes_other": o,
+        }
+        for area_name, name, t, v, a, th, i, o in zip(
+            normalized[keep].tolist(),
+            names,
+            total.tolist(),
+            violent.tolist(),
+            assault.tolist(),
+            theft.tolist(),
+            intellectual.tolist(),
+            other.tolist(),
+        )
+    ]
+
+    logger.info("パース完了: %d 町丁目レコード（%d 行スキップ）", len(records), skipped)
+    return records
+
+
 def load_boundaries(shp_path: str) -> dict[str, dict[str, Any]]:
     """
     小地域境界 Shapefile を読み込み、正規化名をキーにした辞書を返す。
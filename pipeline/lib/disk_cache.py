@@ -0,0 +1,155 @@
+"""
+ディスクキャッシュ
+API レスポンスなどのバイト列を、キーのハッシュをファイル名としてディスクに保存する。
+TTL（書き込みからの経過時間）と合計サイズ上限（最終アクセスが古い順に削除）を持つ
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# サイズ上限を超えたとき、上限のこの割合まで削除する（削除処理の頻度を下げるため）
+_EVICT_TARGET_RATIO = 0.9
+
+
+class DiskCache:
+    """
+    キー → バイト列のディスクキャッシュ。
+
+    エントリはキーの SHA-256 をファイル名として保存する（<dir>/<先頭2桁>/<ハッシュ>）。
+    ファイルの mtime を書き込み時刻（TTL 判定）、atime を最終アクセス時刻（LRU 判定）に使う。
+    atime は読み出し時に os.utime で明示的に更新するため、noatime マウントでも動作する。
+
+    スレッドセーフ（同一プロセス内）。別プロセスと同じディレクトリを共有しても
+    書き込みは一時ファイル経由の置き換えなので壊れたエントリは読まれない。
+
+    使用例:
+        cache = DiskCache(Path("data/cache/tiles"), ttl_s=86400, max_bytes=1 << 30)
+        data = cache.get("XKT026/15/29100/12900")
+        if data is None:
+            data = fetch(...)
+            cache.put("XKT026/15/29100/12900", data)
+    """
+
+    def __init__(
+        self, directory: Path, ttl_s: float | None = None, max_bytes: int | None = None
+    ):
+        """
+        Args:
+            directory: キャッシュディレクトリ（なければ作成）
+            ttl_s: 有効期間（秒）。None なら無期限
+            max_bytes: 合計サイズの上限（バイト）。None なら無制限
+        """
+        self.directory = Path(directory)
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total_bytes: int | None = None  # 初回の put でディレクトリを走査して求める
+
+    def _path(self, key: str) -> Path:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.directory / digest[:2] / digest
+
+    def get(self, key: str) -> bytes | None:
+        """キャッシュ済みのバイト列を返す。未保存・期限切れなら None"""
+        path = self._path(key)
+        try:
+            st = path.stat()
+            if self.ttl_s is not None and time.time() - st.st_mtime > self.ttl_s:
+                with self._lock:
+                    self.misses += 1
+                return None
+            data = path.read_bytes()
+            # atime のみ更新（mtime は書き込み時刻のまま残す）
+            os.utime(path, (time.time(), st.st_mtime))
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """バイト列を保存し、サイズ上限を超えたら古いエントリを削除する"""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            old_size = path.stat().st_size
+        except FileNotFoundError:
+            old_size = 0
+
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += len(data) - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        """[(atime, サイズ, パス), ...]"""
+        entries = []
+        if not self.directory.exists():
+            return entries
+        for path in self.directory.glob("*/*"):
+            if path.suffix == ".tmp":
+                continue
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_atime, st.st_size, path))
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self) -> None:
+        """最終アクセスが古い順に削除して上限の 90% まで減らす（ロック取得済みで呼ぶ）"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * _EVICT_TARGET_RATIO
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self._total_bytes = total
+        logger.debug("キャッシュ削除: %d 件 (%s)", removed, self.directory)
+
+    def clear(self) -> int:
+        """全エントリを削除し、削除件数を返す"""
+        with self._lock:
+            entries = self._entries()
+            for _, _, path in entries:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            self._total_bytes = 0
+        return len(entries)
+
+    def stats(self) -> dict[str, int]:
+        """{"hits": ヒット数, "misses": ミス数}"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
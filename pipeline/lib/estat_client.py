@@ -5,15 +5,34 @@ e-Stat API クライアント
 市区町村レベル: fetch_age_distribution / fetch_household_composition / fetch_daytime_ratio
 小地域（町丁字）レベル: fetch_age_distribution_by_area / fetch_household_by_area
 統合: fetch_all_estat_data（市区町村）/ fetch_all_estat_area_data（小地域＋市区町村フォールバック）
+
+取得結果は VALUE レコードの列データ（area / cat01 / ... / value）として
+data/cache/estat にキャッシュする。国勢調査は5年ごとの更新なので期限は設けず、
+clear_estat_cache()（スクリプトの --refresh-estat）で明示的に削除する。
+
+統合関数はデータセットを並列に取得し、各データセット内でも 2 ページ目以降を
+並列に取得する。e-Stat への同時リクエスト数は ESTAT_CONCURRENCY で全体の上限をかける。
+
+集計で使わない行（男女別・秘匿あり・丁目以外・不要なカテゴリ）は、データセットごとの
+クエリ計画（_QUERY_FILTERS）で cdCat01 / cdCat02 / lvArea として API 側で絞り込む。
+絞り込みの有無で集計結果が変わらないことは verify_query_filters() で確認できる。
 """
 
+import io
+import json
 import logging
+import math
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import Any, Optional
 
+import numpy as np
 import requests
 
-from config.settings import ESTAT_API_KEY
+from config.settings import ESTAT_API_KEY, ESTAT_CONCURRENCY
+from lib.disk_cache import DiskCache
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +49,48 @@ STATS_DAYTIME_POPULATION = "0003454499"
 STATS_AGE_SMALL_AREA: str = "8003006792"       # 年齢（5歳階級、4区分）別、男女別人口 東京都
 STATS_HOUSEHOLD_SMALL_AREA: str = "8003006803"  # 世帯人員別一般世帯数 東京都（単身世帯=世帯人員1人）
 
+# 小地域 年齢構成の cat01 コード（総数系のみ）
+_AREA_AGE_TOTAL = "0010"
+_AREA_AGE_YOUNG = ["0050", "0060", "0070", "0080"]                  # 15-34歳
+_AREA_AGE_FAMILY = ["0090", "0100", "0110", "0120", "0130", "0140"]  # 35-64歳
+_AREA_AGE_ELDERLY = "0150"                                           # 65歳以上
+
+# 小地域 世帯構成の cat01 コード（総世帯数・単身世帯）
+_AREA_HOUSEHOLD_TOTAL = "0010"
+_AREA_HOUSEHOLD_SINGLE = "0020"
+
+# 小地域集計の地域階層（11桁の KEY_CODE = 丁目レベル）と cat02（秘匿フラグ）の「秘匿なし」
+_SMALL_AREA_LEVEL = "4"
+_NOT_SUPPRESSED = "1"
+
+# クエリ計画: データセットごとに API 側で絞り込む条件（statsDataId → 追加パラメータ）。
+# 集計で捨てる行をダウンロードしないためのもので、クライアント側の絞り込みはそのまま残す
+_QUERY_FILTERS: dict[str, dict[str, str]] = {
+    STATS_AGE_SMALL_AREA: {
+        "cdCat01": ",".join(
+            [_AREA_AGE_TOTAL, *_AREA_AGE_YOUNG, *_AREA_AGE_FAMILY, _AREA_AGE_ELDERLY]
+        ),
+        "cdCat02": _NOT_SUPPRESSED,
+        "lvArea": _SMALL_AREA_LEVEL,
+    },
+    STATS_HOUSEHOLD_SMALL_AREA: {
+        "cdCat01": f"{_AREA_HOUSEHOLD_TOTAL},{_AREA_HOUSEHOLD_SINGLE}",
+        "cdCat02": _NOT_SUPPRESSED,
+        "lvArea": _SMALL_AREA_LEVEL,
+    },
+    STATS_HOUSEHOLD_COMPOSITION: {
+        "cdCat01": "0,3",  # 総数・単独世帯
+    },
+}
+
+# 絞り込みありのクエリで返るはずのエリア数の目安（東京都: 約 5,000 丁目 / 62 市区町村）。
+# 実際のエリア数がこの半分に満たなければ、絞り込み条件の誤りを疑って警告する
+_EXPECTED_AREAS: dict[str, int] = {
+    STATS_AGE_SMALL_AREA: 5000,
+    STATS_HOUSEHOLD_SMALL_AREA: 5000,
+    STATS_HOUSEHOLD_COMPOSITION: 62,
+}
+
 # 東京都 市区町村コード範囲
 AREA_FROM = "13101"
 AREA_TO = "13421"
@@ -38,83 +99,143 @@ AREA_TO = "13421"
 SMALL_AREA_FROM = "13101000000"
 SMALL_AREA_TO = "13421999999"
 
+# 1リクエストあたりの取得件数（API の上限）
+PAGE_LIMIT = 100000
+
 # リトライ設定
 MAX_RETRIES = 3
 RETRY_BASE_DELAY = 2  # seconds
 
+# e-Stat への同時リクエスト数の上限（全データセット・全ページ共通）
+_request_slots = threading.BoundedSemaphore(max(1, ESTAT_CONCURRENCY))
+
+# getStatsData の結果キャッシュ
+# キー: クエリパラメータ（appId を除く）、値: 列データを npz 圧縮したバイト列
+_CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "cache" / "estat"
+_cache = DiskCache(_CACHE_DIR)
+
+
+def _get_page(params: dict[str, str]) -> tuple[dict[str, Any], int]:
+    """
+    getStatsData を 1 ページ分取得（リトライ対応）。
+
+    同時リクエスト数は _request_slots で制限する（リトライ待ちの間は枠を空ける）。
+
+    Returns:
+        (レスポンスの JSON, 受信バイト数)
+    """
+    attempt = 0
+    while True:
+        try:
+            with _request_slots:
+                resp = requests.get(BASE_URL, params=params, timeout=60)
+            resp.raise_for_status()
+            return resp.json(), len(resp.content)
+        except requests.RequestException as e:
+            attempt += 1
+            if attempt == MAX_RETRIES:
+                logger.error(
+                    "e-Stat API リクエスト失敗 (statsDataId=%s): %s",
+                    params.get("statsDataId", "?"),
+                    e,
+                )
+                raise
+            wait = RETRY_BASE_DELAY ** attempt
+            logger.warning(
+                "リトライ %d/%d (%ds後): %s", attempt, MAX_RETRIES, wait, e
+            )
+            time.sleep(wait)
+
+
+def _page_columns(data: dict[str, Any]) -> dict[str, np.ndarray]:
+    """レスポンスの VALUE レコードを列データに変換（1件だけのときも配列にする）"""
+    stats_data = data.get("GET_STATS_DATA", {}).get("STATISTICAL_DATA", {})
+    values = stats_data.get("DATA_INF", {}).get("VALUE", [])
+    return _to_columns([values] if isinstance(values, dict) else values)
+
 
-def _fetch_estat_data(
+def _fetch_estat_columns(
     api_key: str, params: dict[str, str]
-) -> list[dict[str, Any]]:
+) -> tuple[dict[str, np.ndarray], int]:
     """
-    e-Stat API からデータを取得（ページネーション・リトライ対応）。
+    e-Stat API からデータを取得し、列データで返す（ページネーション・リトライ対応）。
+
+    各ページは受信した時点で列データに変換し、VALUE の dict は保持しない
+    （メモリに載る dict は常に取得中のページ分だけ）。
+
+    1 ページ目の RESULT_INF（TOTAL_NUMBER / NEXT_KEY）から残りページの
+    startPosition を求め、2 ページ目以降を並列に取得する。
+    TOTAL_NUMBER が取れない場合は NEXT_KEY をたどって順に取得する。
 
     Returns:
-        VALUE レコードのリスト
+        ({"area": ..., "cat01": ..., ..., "value": ...}（API の返却順）, 受信バイト数)
     """
-    all_values: list[dict[str, Any]] = []
+    stats_id = params.get("statsDataId", "?")
     base_params = {
         "appId": api_key,
-        "limit": "100000",
+        "limit": str(PAGE_LIMIT),
         **params,
     }
 
-    next_key = None
-    page = 1
-
-    while True:
-        request_params = {**base_params}
-        if next_key:
-            request_params["startPosition"] = str(next_key)
-
-        data = None
-        for attempt in range(MAX_RETRIES):
-            try:
-                resp = requests.get(BASE_URL, params=request_params, timeout=60)
-                resp.raise_for_status()
-                data = resp.json()
-                break
-            except requests.RequestException as e:
-                if attempt == MAX_RETRIES - 1:
-                    logger.error(
-                        "e-Stat API リクエスト失敗 (statsDataId=%s): %s",
-                        params.get("statsDataId", "?"),
-                        e,
-                    )
-                    raise
-                wait = RETRY_BASE_DELAY ** (attempt + 1)
-                logger.warning(
-                    "リトライ %d/%d (%ds後): %s", attempt + 1, MAX_RETRIES, wait, e
-                )
-                time.sleep(wait)
+    data, n_bytes = _get_page(base_params)
+    result_inf = data.get("GET_STATS_DATA", {}).get("RESULT_INF", {})
+    pages = [_page_columns(data)]
+    del data
+    count = len(pages[0]["value"])
+    if not count:
+        logger.warning("データが空です (statsDataId=%s)", stats_id)
+        return pages[0], n_bytes
+    logger.info(
+        "ページ 1: %d 件取得 (statsDataId=%s, %.1f MB)", count, stats_id, n_bytes / 1e6
+    )
 
-        stats_data = data.get("GET_STATS_DATA", {}).get("STATISTICAL_DATA", {})
-        data_inf = stats_data.get("DATA_INF", {})
-        values = data_inf.get("VALUE", [])
+    next_key = result_inf.get("NEXT_KEY")
+    if not next_key:
+        return pages[0], n_bytes
 
-        if not values:
-            if page == 1:
-                logger.warning(
-                    "データが空です (statsDataId=%s)",
-                    params.get("statsDataId", "?"),
-                )
-            break
-
-        all_values.extend(values)
-        logger.info(
-            "ページ %d: %d 件取得 (累計 %d 件)", page, len(values), len(all_values)
+    try:
+        total = int(result_inf["TOTAL_NUMBER"])
+        starts = list(range(int(next_key), total + 1, PAGE_LIMIT))
+    except (KeyError, TypeError, ValueError):
+        starts = None
+
+    if starts is None:
+        # 総件数が分からない: NEXT_KEY をたどって順に取得
+        while next_key:
+            data, page_bytes = _get_page({**base_params, "startPosition": str(next_key)})
+            n_bytes += page_bytes
+            next_key = data.get("GET_STATS_DATA", {}).get("RESULT_INF", {}).get("NEXT_KEY")
+            page = _page_columns(data)
+            del data
+            if not len(page["value"]):
+                break
+            pages.append(page)
+            count += len(page["value"])
+            logger.info(
+                "ページ %d: %d 件取得 (累計 %d 件)", len(pages), len(page["value"]), count
+            )
+        return _concat_columns(pages), n_bytes
+
+    def load(start: int) -> tuple[dict[str, np.ndarray], int]:
+        data, page_bytes = _get_page({**base_params, "startPosition": str(start)})
+        return _page_columns(data), page_bytes
+
+    with ThreadPoolExecutor(max_workers=max(1, min(ESTAT_CONCURRENCY, len(starts)))) as executor:
+        for page, page_bytes in executor.map(load, starts):
+            pages.append(page)
+            n_bytes += page_bytes
+    table = _concat_columns(pages)
+    count = len(table["value"])
+    logger.info(
+        "全 %d ページ: %d 件取得 (statsDataId=%s, %.1f MB)",
+        len(pages), count, stats_id, n_bytes / 1e6,
+    )
+    if count != total:
+        logger.warning(
+            "取得件数が TOTAL_NUMBER と一致しません (statsDataId=%s): %d / %d",
+            stats_id, count, total,
         )
-
-        # ページネーション: NEXT_KEY を確認
-        result_inf = data.get("GET_STATS_DATA", {}).get("RESULT_INF", {})
-        next_key_val = result_inf.get("NEXT_KEY")
-        if next_key_val:
-            next_key = next_key_val
-            page += 1
-        else:
-            break
-
-    return all_values
+    return table, n_bytes
 
 
 def _parse_value(raw: str) -> Optional[float]:
@@ -127,6 +248,213 @@ def _parse_value(raw: str) -> Optional[float]:
         return None
 
 
+def _to_columns(values: list[dict[str, Any]]) -> dict[str, np.ndarray]:
+    """
+    VALUE レコードのリストを列データに変換。
+
+    属性（@area, @cat01, ...）は先頭の @ を除いた名前の文字列配列、
+    値は "value" の float 配列（秘匿値・欠損値は NaN）にする。
+    """
+    attrs = sorted({k for v in values for k in v if k.startswith("@")})
+    table = {
+        attr[1:]: np.array([v.get(attr, "") for v in values], dtype=str) for attr in attrs
+    }
+    parsed = (_parse_value(v.get("$", "")) for v in values)
+    table["value"] = np.array(
+        [math.nan if p is None else p for p in parsed], dtype=float
+    )
+    return table
+
+
+def _concat_columns(pages: list[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+    """ページごとの列データを連結（ページにない属性列は空文字で埋める）"""
+    names = sorted({k for page in pages for k in page})
+    return {
+        name: np.concatenate([
+            page[name] if name in page else np.full(len(page["value"]), "")
+            for page in pages
+        ])
+        for name in names
+    }
+
+
+def _column(table: dict[str, np.ndarray], name: str) -> np.ndarray:
+    """属性列を返す（ない列は空文字の配列）"""
+    if name in table:
+        return table[name]
+    return np.full(len(table["value"]), "")
+
+
+def _pivot(
+    areas: np.ndarray, cats: np.ndarray, values: np.ndarray, codes: list[str]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    （エリア, カテゴリ, 値）の列をエリア × codes の行列にまとめる。
+
+    codes にないカテゴリの行は無視し、値のない組み合わせは 0 にする。
+    同じ（エリア, カテゴリ）が複数あれば後の行の値を使う。
+
+    Returns:
+        (エリアコードの配列（昇順）, 行列 shape=(エリア数, len(codes)))
+    """
+    area_codes, row = np.unique(areas, return_inverse=True)
+    code_arr = np.asarray(codes)
+    code_order = np.argsort(code_arr)
+    pos = np.minimum(np.searchsorted(code_arr[code_order], cats), len(codes) - 1)
+    hit = code_arr[code_order][pos] == cats
+
+    flat = row[hit] * len(codes) + code_order[pos[hit]]
+    # 重複は後勝ち: 逆順で最初に現れる位置 = 元の順で最後の位置
+    _, last = np.unique(flat[::-1], return_index=True)
+    last = len(flat) - 1 - last
+
+    matrix = np.zeros((len(area_codes), len(codes)))
+    matrix.flat[flat[last]] = values[hit][last]
+    return area_codes, matrix
+
+
+def _age_ratios(
+    areas: np.ndarray,
+    cats: np.ndarray,
+    values: np.ndarray,
+    total_code: str,
+    young_codes: list[str],
+    family_codes: list[str],
+    elderly_code: str,
+) -> dict[str, dict]:
+    """
+    年齢区分別人口から若年・ファミリー・高齢の比率を計算（総数 0 のエリアは除外）。
+
+    Returns:
+        {area_code: {young_ratio, family_ratio, elderly_ratio, total_population}}
+    """
+    codes = [total_code, *young_codes, *family_codes, elderly_code]
+    area_codes, matrix = _pivot(areas, cats, values, codes)
+    n_young = len(young_codes)
+    total = matrix[:, 0]
+    young = matrix[:, 1 : 1 + n_young].sum(axis=1)
+    family = matrix[:, 1 + n_young : -1].sum(axis=1)
+    elderly = matrix[:, -1]
+
+    keep = total != 0
+    return {
+        area: {
+            "young_ratio": round(y, 4),
+            "family_ratio": round(f, 4),
+            "elderly_ratio": round(e, 4),
+            "total_population": int(t),
+        }
+        for area, y, f, e, t in zip(
+            area_codes[keep].tolist(),
+            (young[keep] / total[keep]).tolist(),
+            (family[keep] / total[keep]).tolist(),
+            (elderly[keep] / total[keep]).tolist(),
+            total[keep].tolist(),
+        )
+    }
+
+
+def _single_ratios(
+    areas: np.ndarray, cats: np.ndarray, values: np.ndarray, total_code: str, single_code: str
+) -> dict[str, dict]:
+    """
+    総世帯数と単身世帯数から単身世帯比率を計算（総世帯 0 のエリアは除外）。
+
+    Returns:
+        {area_code: {single_ratio, total_households, single_households}}
+    """
+    area_codes, matrix = _pivot(areas, cats, values, [total_code, single_code])
+    total, single = matrix[:, 0], matrix[:, 1]
+
+    keep = total != 0
+    return {
+        area: {
+            "single_ratio": round(r, 4),
+            "total_households": int(t),
+            "single_households": int(h),
+        }
+        for area, r, t, h in zip(
+            area_codes[keep].tolist(),
+            (single[keep] / total[keep]).tolist(),
+            total[keep].tolist(),
+            single[keep].tolist(),
+        )
+    }
+
+
+def _plan_query(params: dict[str, str]) -> dict[str, str]:
+    """
+    クエリ計画: statsDataId に対応する API 側の絞り込み条件を params に加える。
+    params に同じキーがあれば params の値を優先する。
+    """
+    return {**_QUERY_FILTERS.get(params.get("statsDataId", ""), {}), **params}
+
+
+def _check_planned_result(params: dict[str, str], table: dict[str, np.ndarray]) -> None:
+    """
+    絞り込みありのクエリ結果が 0 件、または想定よりエリア数が大幅に少なければ警告する。
+    API 側のコード体系が変わって絞り込み条件が合わなくなった場合に気付けるようにする。
+    """
+    stats_id = params.get("statsDataId", "")
+    if stats_id not in _QUERY_FILTERS:
+        return
+
+    if not len(table["value"]):
+        logger.warning(
+            "絞り込みありのクエリが 0 件です (statsDataId=%s) — 絞り込み条件を確認してください"
+            "（--verify-estat-filters）",
+            stats_id,
+        )
+        return
+
+    expected = _EXPECTED_AREAS.get(stats_id)
+    n_areas = len(np.unique(_column(table, "area")))
+    if expected and n_areas < expected // 2:
+        logger.warning(
+            "絞り込みありのクエリのエリア数が想定より少ない (statsDataId=%s): %d（目安 %d）"
+            " — 絞り込み条件を確認してください（--verify-estat-filters）",
+            stats_id, n_areas, expected,
+        )
+
+
+def _fetch_estat_table(api_key: str, params: dict[str, str]) -> dict[str, np.ndarray]:
+    """
+    e-Stat API からデータを取得し、列データで返す（キャッシュ対応）。
+
+    params にはクエリ計画の絞り込み条件を加えてから取得する。
+    キャッシュキーは絞り込み後のクエリパラメータ（appId を除く）。空の結果はキャッシュしない。
+    絞り込み後の結果が 0 件・エリア数不足なら警告する（_check_planned_result）。
+
+    Returns:
+        {"area": ..., "cat01": ..., ..., "value": ...} の numpy 配列の dict
+    """
+    params = _plan_query(params)
+    key = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    cached = _cache.get(key)
+    if cached is not None:
+        with np.load(io.BytesIO(cached)) as npz:
+            table = {k: npz[k] for k in npz.files}
+        logger.info(
+            "キャッシュから読み込み (statsDataId=%s): %d 件",
+            params.get("statsDataId", "?"), len(table["value"]),
+        )
+        _check_planned_result(params, table)
+        return table
+
+    table, _ = _fetch_estat_columns(api_key, params)
+    _check_planned_result(params, table)
+    if len(table["value"]):
+        buf = io.BytesIO()
+        np.savez_compressed(buf, **table)
+        _cache.put(key, buf.getvalue())
+    return table
+
+
+def clear_estat_cache() -> int:
+    """e-Stat の取得結果キャッシュを全削除し、削除件数を返す"""
+    return _cache.clear()
+
+
 def fetch_age_distribution(api_key: str) -> dict[str, dict]:
     """
     年齢構成データを取得。
@@ -141,7 +469,7 @@ def fetch_age_distribution(api_key: str) -> dict[str, dict]:
     """
     logger.info("年齢構成データを取得中...")
 
-    values = _fetch_estat_data(api_key, {
+    table = _fetch_estat_table(api_key, {
         "statsDataId": STATS_AGE_DISTRIBUTION,
         "cdCat01": "0",
         "cdCat02": "0",
@@ -149,40 +477,18 @@ def fetch_age_distribution(api_key: str) -> dict[str, dict]:
         "cdAreaTo": AREA_TO,
     })
 
-    # エリア × cat03 で整理
-    area_data: dict[str, dict[str, float]] = {}
-
-    for v in values:
-        area = v.get("@area", "")
-        cat03 = v.get("@cat03", "")
-        parsed = _parse_value(v.get("$", ""))
-
-        if not area or parsed is None:
-            continue
-
-        area_data.setdefault(area, {})[cat03] = parsed
-
-    # 比率を計算
-    young_codes = {"04", "05", "06", "07"}    # 15-34歳
-    family_codes = {"08", "09", "10", "11", "12", "13"}  # 35-64歳
-
-    result: dict[str, dict] = {}
-
-    for area, cats in area_data.items():
-        total = cats.get("00", 0)
-        if total == 0:
-            continue
-
-        young = sum(cats.get(c, 0) for c in young_codes)
-        family = sum(cats.get(c, 0) for c in family_codes)
-        elderly = cats.get("R3", 0)
-
-        result[area] = {
-            "young_ratio": round(young / total, 4),
-            "family_ratio": round(family / total, 4),
-            "elderly_ratio": round(elderly / total, 4),
-            "total_population": int(total),
-        }
+    area = _column(table, "area")
+    value = table["value"]
+    valid = (area != "") & ~np.isnan(value)
+
+    # エリア × cat03 の行列にして比率を計算
+    result = _age_ratios(
+        area[valid], _column(table, "cat03")[valid], value[valid],
+        total_code="00",
+        young_codes=["04", "05", "06", "07"],                # 15-34歳
+        family_codes=["08", "09", "10", "11", "12", "13"],   # 35-64歳
+        elderly_code="R3",
+    )
 
     logger.info("年齢構成データ: %d 市区町村", len(result))
     return result
@@ -200,68 +506,58 @@ def fetch_household_composition(api_key: str) -> dict[str, dict]:
     """
     logger.info("世帯構成データを取得中...")
 
-    values = _fetch_estat_data(api_key, {
+    table = _fetch_estat_table(api_key, {
         "statsDataId": STATS_HOUSEHOLD_COMPOSITION,
         "cdAreaFrom": AREA_FROM,
         "cdAreaTo": AREA_TO,
     })
+    result = _households_by_municipality(table)
 
-    # エリア × cat01 × cat02 で整理
-    area_data: dict[str, dict[str, dict[str, float]]] = {}
-
-    for v in values:
-        area = v.get("@area", "")
-        cat01 = v.get("@cat01", "")
-        cat02 = v.get("@cat02", "")
-        parsed = _parse_value(v.get("$", ""))
-
-        if not area or cat01 not in ("0", "3") or parsed is None:
-            continue
-
-        area_data.setdefault(area, {}).setdefault(cat01, {})[cat02] = parsed
+    logger.info("世帯構成データ: %d 市区町村", len(result))
+    return result
 
-    # cat02 の総数コードを自動検出（最初のエリアの cat01=0 から最大値のコードを使用）
-    total_cat02: Optional[str] = None
-    for area, cats in area_data.items():
-        if "0" not in cats:
-            continue
-        for code in ("0", "00", "000"):
-            if code in cats["0"]:
-                total_cat02 = code
-                break
-        if total_cat02:
-            break
-
-    if total_cat02 is None:
-        # フォールバック: cat01=0 の中で最大値を持つ cat02 コードを使用
-        for area, cats in area_data.items():
-            if "0" in cats and cats["0"]:
-                total_cat02 = max(cats["0"], key=lambda k: cats["0"][k])
-                break
 
-    if total_cat02 is None:
+def _households_by_municipality(table: dict[str, np.ndarray]) -> dict[str, dict]:
+    """市区町村 世帯構成の列データから単身世帯比率を計算（cat02 の総数コードを自動検出）"""
+    area = _column(table, "area")
+    cat01 = _column(table, "cat01")
+    cat02 = _column(table, "cat02")
+    value = table["value"]
+    valid = (area != "") & np.isin(cat01, ["0", "3"]) & ~np.isnan(value)
+
+    # cat02 の総数コードを自動検出:
+    # エリアの出現順に cat01=0 の行から標準の総数コード（0 / 00 / 000 の優先順）を探し、
+    # 最初に見つかったエリアのコードを使う
+    idx = np.flatnonzero(valid)
+    _, first_row, inverse = np.unique(area[idx], return_index=True, return_inverse=True)
+    order = first_row[inverse]  # 各行のエリアが最初に現れた位置（= エリアの出現順）
+    sub_cat02 = cat02[idx]
+    is_total = cat01[idx] == "0"
+    if not is_total.any():
         logger.error("世帯構成データの cat02 総数コードを特定できません")
         return {}
 
-    logger.info("世帯構成 cat02 総数コード: %s", total_cat02)
-
-    result: dict[str, dict] = {}
-
-    for area, cats in area_data.items():
-        total = cats.get("0", {}).get(total_cat02, 0)
-        single = cats.get("3", {}).get(total_cat02, 0)
+    standard_codes = ("0", "00", "000")
+    priority = np.full(len(idx), len(standard_codes))
+    for p, code in enumerate(standard_codes):
+        priority[sub_cat02 == code] = p
+    standard = is_total & (priority < len(standard_codes))
+
+    if standard.any():
+        first_area = standard & (order == order[standard].min())
+        total_cat02 = standard_codes[int(priority[first_area].min())]
+    else:
+        # フォールバック: cat01=0 を持つ最初のエリアで最大値を持つ cat02 コードを使用
+        sample = is_total & (order == order[is_total].min())
+        sample_values = dict(zip(sub_cat02[sample].tolist(), value[idx][sample].tolist()))
+        total_cat02 = max(sample_values, key=lambda k: sample_values[k])
 
-        if total == 0:
-            continue
-
-        result[area] = {
-            "single_ratio": round(single / total, 4),
-            "total_households": int(total),
-            "single_households": int(single),
-        }
+    logger.info("世帯構成 cat02 総数コード: %s", total_cat02)
 
-    logger.info("世帯構成データ: %d 市区町村", len(result))
-    return result
+    rows = valid & (cat02 == total_cat02)
+    return _single_ratios(
+        area[rows], cat01[rows], value[rows], total_code="0", single_code="3"
+    )
 
 
 def fetch_daytime_ratio(api_key: str) -> dict[str, dict]:
@@ -275,7 +571,7 @@ def fetch_daytime_ratio(api_key: str) -> dict[str, dict]:
     """
     logger.info("昼夜間人口比データを取得中...")
 
-    values = _fetch_estat_data(api_key, {
+    table = _fetch_estat_table(api_key, {
         "statsDataId": STATS_DAYTIME_POPULATION,
         "cdCat01": "0",
         "cdCat02": "00",
@@ -283,18 +579,14 @@ def fetch_daytime_ratio(api_key: str) -> dict[str, dict]:
         "cdAreaTo": AREA_TO,
     })
 
-    result: dict[str, dict] = {}
-
-    for v in values:
-        area = v.get("@area", "")
-        parsed = _parse_value(v.get("$", ""))
+    area = _column(table, "area")
+    value = table["value"]
+    valid = (area != "") & ~np.isnan(value)
 
-        if not area or parsed is None:
-            continue
-
-        result[area] = {
-            "daytime_ratio": round(parsed / 100, 4),
-        }
+    result: dict[str, dict] = {
+        a: {"daytime_ratio": round(v, 4)}
+        for a, v in zip(area[valid].tolist(), (value[valid] / 100).tolist())
+    }
 
     logger.info("昼夜間人口比データ: %d 市区町村", len(result))
     return result
@@ -314,9 +606,14 @@ def fetch_all_estat_data(api_key: Optional[str] = None) -> dict[str, dict]:
     if not api_key:
         raise ValueError("ESTAT_API_KEY が設定されていません")
 
-    age_data = fetch_age_distribution(api_key)
-    household_data = fetch_household_composition(api_key)
-    daytime_data = fetch_daytime_ratio(api_key)
+    # 3 データセットは独立なので並列に取得する
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        age_future = executor.submit(fetch_age_distribution, api_key)
+        household_future = executor.submit(fetch_household_composition, api_key)
+        daytime_future = executor.submit(fetch_daytime_ratio, api_key)
+        age_data = age_future.result()
+        household_data = household_future.result()
+        daytime_data = daytime_future.result()
 
     # 市区町村コードでマージ
     all_codes = set(age_data) | set(household_data) | set(daytime_data)
@@ -339,6 +636,37 @@ def fetch_all_estat_data(api_key: Optional[str] = None) -> dict[str, dict]:
 # ── 小地域（町丁字）レベル ────────────────────────────────
 
 
+def _small_area_rows(table: dict[str, np.ndarray]) -> np.ndarray:
+    """小地域データのうち集計に使う行（11桁の丁目レベル・秘匿なし・値あり）のマスク"""
+    return (
+        (np.char.str_len(_column(table, "area")) == 11)
+        & (_column(table, "cat02") == _NOT_SUPPRESSED)
+        & ~np.isnan(table["value"])
+    )
+
+
+def _age_by_area(table: dict[str, np.ndarray]) -> dict[str, dict]:
+    """小地域 年齢構成の列データから比率を計算"""
+    valid = _small_area_rows(table)
+    return _age_ratios(
+        _column(table, "area")[valid], _column(table, "cat01")[valid], table["value"][valid],
+        total_code=_AREA_AGE_TOTAL,
+        young_codes=_AREA_AGE_YOUNG,
+        family_codes=_AREA_AGE_FAMILY,
+        elderly_code=_AREA_AGE_ELDERLY,
+    )
+
+
+def _households_by_area(table: dict[str, np.ndarray]) -> dict[str, dict]:
+    """小地域 世帯構成の列データから単身世帯比率を計算"""
+    valid = _small_area_rows(table)
+    return _single_ratios(
+        _column(table, "area")[valid], _column(table, "cat01")[valid], table["value"][valid],
+        total_code=_AREA_HOUSEHOLD_TOTAL,
+        single_code=_AREA_HOUSEHOLD_SINGLE,
+    )
+
+
 def fetch_age_distribution_by_area(api_key: str) -> dict[str, dict]:
     """
     小地域（町丁字）レベルの年齢構成データを取得。
@@ -362,43 +690,10 @@ def fetch_age_distribution_by_area(api_key: str) -> dict[str, dict]:
     """
     logger.info("小地域 年齢構成データを取得中 (statsDataId=%s)...", STATS_AGE_SMALL_AREA)
     try:
-        values = _fetch_estat_data(api_key, {
+        table = _fetch_estat_table(api_key, {
             "statsDataId": STATS_AGE_SMALL_AREA,
         })
-
-        area_data: dict[str, dict[str, float]] = {}
-        for v in values:
-            area = v.get("@area", "")
-            # 11桁（丁目レベル）のみ対象、秘匿データは除外
-            if len(area) != 11:
-                continue
-            cat02 = v.get("@cat02", "")
-            if cat02 != "1":
-                continue
-            cat01 = v.get("@cat01", "")
-            parsed = _parse_value(v.get("$", ""))
-            if not cat01 or parsed is None:
-                continue
-            area_data.setdefault(area, {})[cat01] = parsed
-
-        # 小地域集計の cat01 コード（総数系のみ）
-        young_codes = {"0050", "0060", "0070", "0080"}       # 15-34歳
-        family_codes = {"0090", "0100", "0110", "0120", "0130", "0140"}  # 35-64歳
-
-        result: dict[str, dict] = {}
-        for area, cats in area_data.items():
-            total = cats.get("0010", 0)
-            if total == 0:
-                continue
-            young = sum(cats.get(c, 0) for c in young_codes)
-            family = sum(cats.get(c, 0) for c in family_codes)
-            elderly = cats.get("0150", 0)  # 65歳以上
-            result[area] = {
-                "young_ratio": round(young / total, 4),
-                "family_ratio": round(family / total, 4),
-                "elderly_ratio": round(elderly / total, 4),
-                "total_population": int(total),
-            }
+        result = _age_by_area(table)
 
         if result:
             logger.info("小地域 年齢構成データ: %d エリア", len(result))
@@ -430,38 +725,10 @@ def fetch_household_by_area(api_key: str) -> dict[str, dict]:
     """
     logger.info("小地域 世帯構成データを取得中 (statsDataId=%s)...", STATS_HOUSEHOLD_SMALL_AREA)
     try:
-        values = _fetch_estat_data(api_key, {
+        table = _fetch_estat_table(api_key, {
             "statsDataId": STATS_HOUSEHOLD_SMALL_AREA,
         })
-
-        area_data: dict[str, dict[str, float]] = {}
-        for v in values:
-            area = v.get("@area", "")
-            if len(area) != 11:
-                continue
-            cat02 = v.get("@cat02", "")
-            if cat02 != "1":
-                continue
-            cat01 = v.get("@cat01", "")
-            # 総世帯数(0010) と 単身世帯(0020) のみ必要
-            if cat01 not in ("0010", "0020"):
-                continue
-            parsed = _parse_value(v.get("$", ""))
-            if parsed is None:
-                continue
-            area_data.setdefault(area, {})[cat01] = parsed
-
-        result: dict[str, dict] = {}
-        for area, cats in area_data.items():
-            total = cats.get("0010", 0)
-            single = cats.get("0020", 0)
-            if total == 0:
-                continue
-            result[area] = {
-                "single_ratio": round(single / total, 4),
-                "total_households": int(total),
-                "single_households": int(single),
-            }
+        result = _households_by_area(table)
 
         if result:
             logger.info("小地域 世帯構成データ: %d エリア", len(result))
@@ -501,9 +768,14 @@ def fetch_all_estat_area_data(api_key: Optional[str] = None) -> dict[str, dict]:
     if not api_key:
         raise ValueError("ESTAT_API_KEY が設定されていません")
 
-    age_data = fetch_age_distribution_by_area(api_key)
-    household_data = fetch_household_by_area(api_key)
-    daytime_data = fetch_daytime_ratio(api_key)
+    # 3 データセットは独立なので並列に取得する
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        age_future = executor.submit(fetch_age_distribution_by_area, api_key)
+        household_future = executor.submit(fetch_household_by_area, api_key)
+        daytime_future = executor.submit(fetch_daytime_ratio, api_key)
+        age_data = age_future.result()
+        household_data = household_future.result()
+        daytime_data = daytime_future.result()
 
     # 小地域レベルか市区町村レベルかを判定
     # 小地域の場合 area_code は 11桁、市区町村の場合は 5桁
@@ -532,3 +804,59 @@ def fetch_all_estat_area_data(api_key: Optional[str] = None) -> dict[str, dict]:
         len(all_codes), level_str, len(daytime_data),
     )
     return result
+
+
+def verify_query_filters(api_key: Optional[str] = None) -> bool:
+    """
+    クエリ計画の絞り込みで集計結果が変わらないことを確認する。
+
+    絞り込み条件のあるデータセット（小地域の年齢・世帯構成、市区町村の世帯構成）ごとに、
+    絞り込みなし（従来のクエリ）と絞り込みありの両方をキャッシュを使わずに取得し、
+    集計結果を比較する。受信バイト数と取得・変換時間もログに出す。
+
+    Returns:
+        全データセットで集計結果が一致すれば True
+    """
+    if api_key is None:
+        api_key = ESTAT_API_KEY
+
+    if not api_key:
+        raise ValueError("ESTAT_API_KEY が設定されていません")
+
+    all_equal = True
+    for params, summarize in (
+        ({"statsDataId": STATS_AGE_SMALL_AREA}, _age_by_area),
+        ({"statsDataId": STATS_HOUSEHOLD_SMALL_AREA}, _households_by_area),
+        (
+            {
+                "statsDataId": STATS_HOUSEHOLD_COMPOSITION,
+                "cdAreaFrom": AREA_FROM,
+                "cdAreaTo": AREA_TO,
+            },
+            _households_by_municipality,
+        ),
+    ):
+        stats_id = params["statsDataId"]
+        measured = []
+        for query in (params, _plan_query(params)):
+            started = time.monotonic()
+            table, n_bytes = _fetch_estat_columns(api_key, query)
+            result = summarize(table)
+            measured.append((result, len(table["value"]), n_bytes, time.monotonic() - started))
+
+        full, full_rows, full_bytes, full_s = measured[0]
+        planned, planned_rows, planned_bytes, planned_s = measured[1]
+        equal = full == planned
+        all_equal = all_equal and equal
+        logger.info(
+            "statsDataId=%s: %s（%d エリア）| 絞り込みなし %d 件 %.1f MB %.1f 秒 → "
+            "絞り込みあり %d 件 %.1f MB %.1f 秒",
+            stats_id, "一致" if equal else "不一致", len(full),
+            full_rows, full_bytes / 1e6, full_s,
+            planned_rows, planned_bytes / 1e6, planned_s,
+        )
+        if not equal:
+            diff = sorted(a for a in set(full) | set(planned) if full.get(a) != planned.get(a))
+            logger.warning("  差分のあるエリア: %d 件（例: %s）", len(diff), diff[:5])
+
+    return all_equal
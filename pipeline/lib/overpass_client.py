@@ -4,17 +4,46 @@ Overpass API クライアント
 
 2つの取得モード:
 - バッチモード: 少数（~100件以下）の地点を個別クエリ（駅向け）
+  バッチはエンドポイントごとのワーカーが共有キューから取り出して並列取得する
 - 一括モード: 大量（~1000件以上）の地点をbbox一括取得+ローカル割り当て（丁目向け）
+  bbox は地点密度に応じてシャードに分割し、エンドポイント間で並列取得する
+
+取得した施設は座標・カテゴリの列データにして data/cache/overpass にキャッシュする。
+一括モードのシャードは固定グリッドの四分木セルなので、検索半径を変えた再実行や
+中断後の再実行でも取得済みのセルを使い回せる。
+バッチモードは地点ごとに「その地点の半径内の施設」を保存するので、バッチの区切り
+（セルごとのバッチサイズ）や検索半径（同じか小さい半径）が変わっても使い回せる。
+
+Overpass を使わずに、ローカルの .osm.pbf 抽出（Geofabrik の kanto など）から
+集計することもできる（fetch_local_facilities、要 pyosmium）。
+
+2つの集計方式（count_mode）:
+- "nearest": 各施設を radius_m 以内の最寄り地点1つにだけ数える（地点間で重複しない）
+- "radius": 各地点から radius_m 以内の施設をすべて数える（「半径1km以内の施設数」）
 """
 
+import io
+import json
 import logging
+import os
 import math
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import numpy as np
 import requests
 
-from config.settings import STATION_RADIUS_M
+from config.settings import (
+    OVERPASS_CACHE_MAX_MB,
+    OVERPASS_CACHE_TTL_DAYS,
+    STATION_RADIUS_M,
+)
+from lib.disk_cache import DiskCache
+from lib.rate_limit import AdaptiveTokenBucket
+from lib.spatial_index import GridIndex, geohash_np
 
 logger = logging.getLogger(__name__)
 
@@ -28,11 +57,38 @@ _ENDPOINTS = [
 _MAX_RETRIES = 5
 _REQUEST_TIMEOUT = 120
 _BULK_TIMEOUT = 180  # 一括クエリ用（大きいレスポンス対応）
-_BATCH_SIZE = 10  # バッチモードの1クエリあたりの駅数
+_BATCH_SIZE = 10  # バッチモードの1クエリあたりの駅数（統計がないセルの初期値）
 _BATCH_DELAY = 5  # バッチ間の待機秒数
 
-# 一括モードの閾値（無効化: バッチモードのみ使用）
-_BULK_THRESHOLD = 999999
+# バッチモードのワーカー（エンドポイントごとに1つ）のレート制御（リクエスト数/秒）。
+# 初期値はバッチ間隔 _BATCH_DELAY 相当で、成功ごとに加算、429/504/タイムアウトで半減する
+_WORKER_MIN_RATE = 1 / 120
+_WORKER_MAX_RATE = 0.5
+_WORKER_RATE_STEP = 0.02
+
+# バッチサイズの適応調整
+# 地点を geohash セル（5文字 ≒ 4.9km 四方）ごとにまとめ、セルごとのバッチサイズを
+# 前回までの応答時間・要素数・タイムアウトから決める（data/cache/overpass_stats.json に記録）
+_BATCH_CELL_PRECISION = 5
+_BATCH_SIZE_MIN = 1
+_BATCH_SIZE_MAX = 50
+# 1リクエストあたりの目標応答時間（秒）と目標要素数
+_BATCH_TARGET_LATENCY_S = 20
+_BATCH_TARGET_ELEMENTS = 3000
+_BATCH_STATS_PATH = Path(__file__).resolve().parent.parent / "data" / "cache" / "overpass_stats.json"
+
+# 一括モードの閾値（これを超える地点数なら一括モード）
+_BULK_THRESHOLD = 100
+
+# 一括モードのシャード分割
+# シャードは緯度経度 0 度を原点とする固定グリッドの四分木セル (level, ix, iy)。
+# level 0 のセルの一辺（度）と、地点数によらずそれ以上分割しない level（0.32 / 2^5 = 0.01 度）
+_SHARD_ROOT_DEG = 0.32
+_SHARD_MAX_LEVEL = 5
+# 1シャードの検索範囲に入る地点数の上限（施設密度の代理指標。都心ほどシャードが小さくなる）
+_SHARD_MAX_POINTS = 200
+# タイムアウトしたシャードを4分割して再取得する最大回数
+_SHARD_MAX_SPLITS = 2
 
 
 def _zero_counts():
@@ -45,18 +101,28 @@ def _zero_counts():
     }
 
 
+# 施設カテゴリ（配列で扱うときのカテゴリ番号はこの並び順）
+_CATEGORIES = list(_zero_counts())
+
+# 集計方式
+COUNT_MODES = ("nearest", "radius")
+
+
 # ── 共通ユーティリティ ────────────────────────────────
 
 
-def _execute_query(query, endpoint_idx=0, timeout=None):
+def _execute_query(query, endpoint_idx=0, timeout=None, rotate=True):
     """
     Overpass クエリを実行（エンドポイントローテーション + リトライ）。
+
+    rotate=False ならリトライも endpoint_idx のエンドポイントに送る
+    （エンドポイントごとのワーカーから呼ぶ場合、他のワーカーのサーバーに重ねないため）。
     """
     if timeout is None:
         timeout = _REQUEST_TIMEOUT
 
     for attempt in range(_MAX_RETRIES):
-        ep_idx = (endpoint_idx + attempt) % len(_ENDPOINTS)
+        ep_idx = (endpoint_idx + attempt) % len(_ENDPOINTS) if rotate else endpoint_idx
         url = _ENDPOINTS[ep_idx]
 
         try:
@@ -94,17 +160,35 @@ def _execute_query(query, endpoint_idx=0, timeout=None):
     return None
 
 
-def _haversine_m(lat1, lng1, lat2, lng2):
-    """2点間の距離をメートルで算出"""
-    R = 6371000
-    rlat1, rlat2 = math.radians(lat1), math.radians(lat2)
-    dlat = math.radians(lat2 - lat1)
-    dlng = math.radians(lng2 - lng1)
-    a = (
-        math.sin(dlat / 2) ** 2
-        + math.cos(rlat1) * math.cos(rlat2) * math.sin(dlng / 2) ** 2
-    )
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+def _query_once(query, endpoint_idx, timeout=None):
+    """
+    指定エンドポイントにクエリを1回だけ送る（リトライ・待機なし、並列ワーカー用）。
+
+    Overpass がクエリのタイムアウトを HTTP 200 + remark で返した場合も失敗とする。
+
+    Returns:
+        (レスポンス JSON, タイムアウトか)。失敗ならレスポンスは None。
+        タイムアウト（クエリが重すぎる）は 429/504 など（サーバー側の混雑）と区別する
+    """
+    url = _ENDPOINTS[endpoint_idx]
+    host = url.split("//")[1].split("/")[0]
+    try:
+        resp = requests.post(
+            url, data={"data": query}, timeout=timeout or _REQUEST_TIMEOUT
+        )
+        resp.raise_for_status()
+        data = resp.json()
+    except requests.Timeout as e:
+        logger.warning("Overpass [%s] タイムアウト: %s", host, e)
+        return None, True
+    except requests.RequestException as e:
+        logger.warning("Overpass [%s] 失敗: %s", host, e)
+        return None, False
+
+    if "runtime error" in data.get("remark", ""):
+        logger.warning("Overpass [%s] クエリタイムアウト: %s", host, data["remark"])
+        return None, True
+    return data, False
 
 
 def _get_element_coords(el):
@@ -133,6 +217,105 @@ def _classify_element(el):
     return None
 
 
+# ── 施設テーブルとキャッシュ ─────────────────────────
+
+# 施設テーブルの列（uid: OSM の type + id、cats: _CATEGORIES の番号）
+_TABLE_COLUMNS = ("uids", "lats", "lngs", "cats")
+
+# 取得した施設のディスクキャッシュ
+# キー: cell/<level>/<ix>/<iy>（一括モードのシャード）または point/<緯度>,<経度>（バッチモードの地点）
+# 値: 施設テーブルを npz 圧縮したバイト列（レスポンスの JSON 全体は保存しない）
+_FACILITY_CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "cache" / "overpass"
+_facility_cache = DiskCache(
+    _FACILITY_CACHE_DIR,
+    ttl_s=OVERPASS_CACHE_TTL_DAYS * 86400,
+    max_bytes=OVERPASS_CACHE_MAX_MB * 1024 * 1024,
+)
+
+
+def _element_uid(el):
+    """OSM 要素の通し番号（node と way は ID が重複しうるので type を最下位ビットに入れる）"""
+    return el["id"] * 2 + (1 if el.get("type") == "way" else 0)
+
+
+def _facility_table(elements):
+    """
+    Overpass 要素を施設テーブル（列データ）に変換（座標なし・対象外カテゴリは除外）。
+
+    Returns:
+        {"uids", "lats", "lngs", "cats"} → numpy 配列 の dict
+    """
+    cat_index = {c: i for i, c in enumerate(_CATEGORIES)}
+    uids = []
+    lats = []
+    lngs = []
+    cats = []
+    for el in elements:
+        lat, lng = _get_element_coords(el)
+        ftype = _classify_element(el)
+        if lat is None or ftype is None:
+            continue
+        uids.append(_element_uid(el))
+        lats.append(lat)
+        lngs.append(lng)
+        cats.append(cat_index[ftype])
+    return {
+        "uids": np.array(uids, dtype=np.int64),
+        "lats": np.array(lats, dtype=float),
+        "lngs": np.array(lngs, dtype=float),
+        "cats": np.array(cats, dtype=np.int64),
+    }
+
+
+def _concat_tables(tables):
+    """施設テーブルを連結し、uid で重複排除する（シャード境界上の施設は複数シャードに含まれる）"""
+    tables = list(tables)
+    if not tables:
+        return _facility_table([])
+    merged = {k: np.concatenate([t[k] for t in tables]) for k in _TABLE_COLUMNS}
+    _, first = np.unique(merged["uids"], return_index=True)
+    first.sort()
+    return {k: v[first] for k, v in merged.items()}
+
+
+def _filter_table(table, bbox):
+    """施設テーブルから bbox 内（境界を含む）の施設だけを取り出す"""
+    s, w, n, e = bbox
+    lats, lngs = table["lats"], table["lngs"]
+    mask = (lats >= s) & (lats <= n) & (lngs >= w) & (lngs <= e)
+    return {k: table[k][mask] for k in _TABLE_COLUMNS}
+
+
+def _cache_get(key):
+    """キャッシュから施設テーブルを読む。なければ None（付加情報の列もそのまま返す）"""
+    data = _facility_cache.get(key)
+    if data is None:
+        return None
+    with np.load(io.BytesIO(data)) as npz:
+        table = {k: npz[k] for k in npz.files}
+    table["cats"] = table["cats"].astype(np.int64)
+    return table
+
+
+def _cache_put(key, table, **extra):
+    """施設テーブルをキャッシュに保存する（extra は検索半径などの付加情報）"""
+    buf = io.BytesIO()
+    np.savez_compressed(
+        buf,
+        uids=table["uids"],
+        lats=table["lats"],
+        lngs=table["lngs"],
+        cats=table["cats"].astype(np.int8),
+        **extra,
+    )
+    _facility_cache.put(key, buf.getvalue())
+
+
+def clear_facility_cache():
+    """取得済み施設のキャッシュを全削除し、削除件数を返す"""
+    return _facility_cache.clear()
+
+
 # ── 一括モード（大量地点向け）──────────────────────────
 
 
@@ -153,112 +336,301 @@ def _build_bulk_query(bbox, timeout=180):
     )
 
 
-def _assign_facilities_vectorized(stations, elements, radius_m):
+def _cell_bbox(cell):
+    """四分木セル (level, ix, iy) → bbox (south, west, north, east)"""
+    level, ix, iy = cell
+    size = _SHARD_ROOT_DEG / (1 << level)
+    return (
+        round(iy * size, 7),
+        round(ix * size, 7),
+        round((iy + 1) * size, 7),
+        round((ix + 1) * size, 7),
+    )
+
+
+def _cell_key(cell):
+    return "cell/%d/%d/%d" % cell
+
+
+def _split_cell(cell):
+    """セルを4つの子セルに分割"""
+    level, ix, iy = cell
+    return [(level + 1, 2 * ix + dx, 2 * iy + dy) for dy in (0, 1) for dx in (0, 1)]
+
+
+def _padded_bounds(stations, radius_m):
+    """各地点の検索範囲（半径分パディングした矩形）を (south, west, north, east) 配列で返す"""
+    lats = np.array([s["lat"] for s in stations], dtype=float)
+    lngs = np.array([s["lng"] for s in stations], dtype=float)
+    pad_lat = radius_m / 111000  # メートル→度の近似変換
+    pad_lng = pad_lat / np.cos(np.radians(lats))
+    return lats - pad_lat, lngs - pad_lng, lats + pad_lat, lngs + pad_lng
+
+
+def _points_in_bbox(bounds, bbox):
+    """検索範囲が bbox と重なる地点のマスク"""
+    south, west, north, east = bounds
+    s, w, n, e = bbox
+    return (north >= s) & (south <= n) & (east >= w) & (west <= e)
+
+
+def _plan_shards(stations, radius_m):
     """
-    numpy ベクトル演算で各施設を最寄りエリアに割り当て。
+    全地点の検索範囲を覆う level 0 セルから四分木で分割し、シャード（セル）一覧を返す。
 
-    計算量: O(施設数 × エリア数) だが numpy で高速化されるため
-    100K施設 × 5Kエリア でも数十秒で完了する。
+    検索範囲が重なる地点数が _SHARD_MAX_POINTS を超えるセルは4分割する。
+    地点が1つも重ならないセルは取得不要なので除外する。
+    セルは固定グリッドなので、検索半径や地点集合が変わっても同じセルはキャッシュを共有できる。
     """
-    results = [_zero_counts() for _ in stations]
+    bounds = _padded_bounds(stations, radius_m)
+    south, west, north, east = bounds
+    stack = [
+        (0, ix, iy)
+        for ix in range(
+            math.floor(west.min() / _SHARD_ROOT_DEG), math.floor(east.max() / _SHARD_ROOT_DEG) + 1
+        )
+        for iy in range(
+            math.floor(south.min() / _SHARD_ROOT_DEG), math.floor(north.max() / _SHARD_ROOT_DEG) + 1
+        )
+    ]
+    shards = []
 
-    # 施設をパース
-    fac_lats = []
-    fac_lngs = []
-    fac_types = []
-    for el in elements:
-        lat, lng = _get_element_coords(el)
-        ftype = _classify_element(el)
-        if lat is None or ftype is None:
+    while stack:
+        cell = stack.pop()
+        count = int(_points_in_bbox(bounds, _cell_bbox(cell)).sum())
+        if count == 0:
             continue
-        fac_lats.append(lat)
-        fac_lngs.append(lng)
-        fac_types.append(ftype)
+        if count > _SHARD_MAX_POINTS and cell[0] < _SHARD_MAX_LEVEL:
+            stack.extend(_split_cell(cell))
+        else:
+            shards.append(cell)
 
-    if not fac_lats:
-        return results
+    return shards
 
-    num_facilities = len(fac_lats)
-    logger.info("施設データ: %d 件を %d エリアに割り当て中...", num_facilities, len(stations))
 
-    # エリア座標をラジアンに変換
-    area_lats_rad = np.radians([s["lat"] for s in stations])
-    area_lngs_rad = np.radians([s["lng"] for s in stations])
-    cos_area_lats = np.cos(area_lats_rad)
+def _cached_children(cell, depth):
+    """4つの子セル（depth 段下まで）がすべてキャッシュにあれば連結して返す"""
+    if depth <= 0:
+        return None
+    tables = []
+    for child in _split_cell(cell):
+        table = _cache_get(_cell_key(child))
+        if table is None:
+            table = _cached_children(child, depth - 1)
+        if table is None:
+            return None
+        tables.append(table)
+    return _concat_tables(tables)
 
-    R = 6371000.0
 
-    # チャンク処理（メモリ効率のため）
-    chunk_size = 5000
-    assigned = 0
+def _cached_cell(cell):
+    """
+    セルの施設テーブルをキャッシュから組み立てる。なければ None。
 
-    for chunk_start in range(0, num_facilities, chunk_size):
-        chunk_end = min(chunk_start + chunk_size, num_facilities)
+    セル自体 → 祖先セル（セルの bbox で切り出す）→ 子セル（タイムアウト分割で
+    保存されたもの）の順に探す。祖先から切り出すと、セル外に中心がある way は
+    落ちるが、その中心を含むセルも検索範囲に重なるので集計結果は変わらない。
+    """
+    table = _cache_get(_cell_key(cell))
+    if table is not None:
+        return table
 
-        for i in range(chunk_start, chunk_end):
-            flat = math.radians(fac_lats[i])
-            flng = math.radians(fac_lngs[i])
+    level, ix, iy = cell
+    for up in range(1, level + 1):
+        table = _cache_get(_cell_key((level - up, ix >> up, iy >> up)))
+        if table is not None:
+            return _filter_table(table, _cell_bbox(cell))
 
-            dlat = flat - area_lats_rad
-            dlng = flng - area_lngs_rad
-            a = (
-                np.sin(dlat / 2) ** 2
-                + math.cos(flat) * cos_area_lats * np.sin(dlng / 2) ** 2
-            )
-            distances = R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return _cached_children(cell, _SHARD_MAX_SPLITS)
 
-            min_idx = int(np.argmin(distances))
-            if distances[min_idx] <= radius_m:
-                results[min_idx][fac_types[i]] += 1
-                assigned += 1
 
-        if chunk_end % 20000 == 0 or chunk_end == num_facilities:
-            logger.info(
-                "  割り当て進捗: %d / %d 施設 (%d 件割り当て済み)",
-                chunk_end, num_facilities, assigned,
-            )
+def _fetch_shard(cell, endpoint_idx, splits_left=_SHARD_MAX_SPLITS):
+    """
+    1シャード（セル）分の施設を endpoint_idx のエンドポイントから取得してキャッシュに保存。
+    タイムアウト等で失敗したら4分割して再取得する（最大 splits_left 回）。
 
-    logger.info("施設割り当て完了: %d / %d 件", assigned, num_facilities)
+    Returns:
+        施設テーブル。分割しても取得できなければ None
+    """
+    bbox = _cell_bbox(cell)
+    query = _build_bulk_query(bbox, timeout=_BULK_TIMEOUT)
+    data = _execute_query(query, endpoint_idx, timeout=_BULK_TIMEOUT, rotate=False)
+
+    # Overpass はクエリのタイムアウトを HTTP 200 + remark で返す（要素は途中まで）
+    if data is not None and "runtime error" in data.get("remark", ""):
+        logger.warning("シャード (%.3f,%.3f,%.3f,%.3f) がタイムアウト: %s", *bbox, data["remark"])
+        data = None
+
+    if data is not None:
+        table = _facility_table(data.get("elements", []))
+        _cache_put(_cell_key(cell), table)
+        return table
+
+    if splits_left <= 0:
+        return None
+
+    logger.info("シャードを4分割して再取得: (%.3f,%.3f,%.3f,%.3f)", *bbox)
+    tables = []
+    for sub in _split_cell(cell):
+        table = _cache_get(_cell_key(sub))
+        if table is None:
+            table = _fetch_shard(sub, endpoint_idx, splits_left - 1)
+        if table is None:
+            return None
+        tables.append(table)
+    return _concat_tables(tables)
+
+
+def _counts_from_matrix(matrix):
+    """(地点数 × カテゴリ数) の集計行列を施設カウント dict のリストに変換"""
+    return [dict(zip(_CATEGORIES, map(int, row))) for row in matrix]
+
+
+def _count_facilities(stations, fac_lats, fac_lngs, fac_cats, radius_m, count_mode="nearest"):
+    """
+    施設の列データを地点ごと・カテゴリ別に集計する。
+
+    地点のグリッドインデックス（lib.spatial_index.GridIndex）で施設と地点の
+    近傍ペアを施設チャンク単位で求め、(地点 × カテゴリ) の件数を
+    np.bincount でまとめて加算する。作業メモリは施設数によらず一定。
+
+    Args:
+        count_mode: "nearest"（最寄り地点1つにだけ数える）/ "radius"（半径内の全地点に数える）
+
+    Returns:
+        (地点数 × カテゴリ数) の件数行列
+    """
+    if count_mode not in COUNT_MODES:
+        raise ValueError(f"count_mode は {COUNT_MODES} のいずれか: {count_mode}")
+
+    n_cats = len(_CATEGORIES)
+    size = len(stations) * n_cats
+    matrix = np.zeros(size, dtype=np.int64)
+    if len(fac_lats) == 0 or not stations:
+        return matrix.reshape(len(stations), n_cats)
+
+    index = GridIndex(
+        [s["lat"] for s in stations], [s["lng"] for s in stations], cell_m=radius_m
+    )
+
+    if count_mode == "nearest":
+        nearest, _ = index.query_nearest(fac_lats, fac_lngs, radius_m)
+        assigned = nearest >= 0
+        matrix += np.bincount(nearest[assigned] * n_cats + fac_cats[assigned], minlength=size)
+    else:
+        for fac_idx, station_idx, _ in index.iter_pairs(fac_lats, fac_lngs, radius_m):
+            matrix += np.bincount(station_idx * n_cats + fac_cats[fac_idx], minlength=size)
+
+    return matrix.reshape(len(stations), n_cats)
+
+
+def _count_table(stations, table, radius_m, count_mode="nearest"):
+    """施設テーブルを地点ごと・カテゴリ別に集計し、施設カウント dict のリストを返す"""
+    matrix = _count_facilities(
+        stations, table["lats"], table["lngs"], table["cats"], radius_m, count_mode
+    )
+    return _counts_from_matrix(matrix)
+
+
+def _assign_facilities_vectorized(stations, table, radius_m, count_mode="nearest"):
+    """
+    numpy ベクトル演算で各施設をエリアに割り当てて集計（一括モード用）。
+    集計方式は count_mode（"nearest" / "radius"）で選ぶ。
+    """
+    if len(table["lats"]) == 0:
+        return [_zero_counts() for _ in stations]
+
+    logger.info(
+        "施設データ: %d 件を %d エリアに集計中 (count_mode=%s)...",
+        len(table["lats"]), len(stations), count_mode,
+    )
+    results = _count_table(stations, table, radius_m, count_mode)
+    logger.info("施設集計完了: 延べ %d 件", sum(sum(c.values()) for c in results))
     return results
 
 
-def _fetch_bulk(stations, radius_m):
+def _fetch_bulk(stations, radius_m, count_mode="nearest"):
     """
     一括取得モード:
-    1. 全地点のbboxを算出（+ radius分のパディング）
-    2. bbox内の全施設を1クエリで取得
-    3. numpy で各施設を最寄り地点に割り当て
-    """
-    # bbox 算出（radius 分のパディングを追加）
-    lats = [s["lat"] for s in stations]
-    lngs = [s["lng"] for s in stations]
-    pad_deg = radius_m / 111000  # メートル→度の近似変換
-
-    bbox = (
-        min(lats) - pad_deg,
-        min(lngs) - pad_deg,
-        max(lats) + pad_deg,
-        max(lngs) + pad_deg,
+    1. 全地点の検索範囲を覆うグリッドセルを地点密度に応じて四分木で分割
+    2. キャッシュにないシャードをエンドポイントごとのワーカーで並列取得し、OSM の type + id で重複排除
+       （各ワーカーは共有キューからシャードを取り出し、担当エンドポイントにだけ送る）
+    3. numpy で各施設をエリアに割り当て
+
+    取得に失敗したシャードに検索範囲が重なる地点は、バッチモードで取り直す。
+    """
+    shards = _plan_shards(stations, radius_m)
+    tables = [_cached_cell(cell) for cell in shards]
+    missing = [i for i, table in enumerate(tables) if table is None]
+    logger.info(
+        "一括取得モード: %d 地点 → %d シャード (キャッシュ %d / 取得 %d, %d エンドポイント並列)",
+        len(stations), len(shards), len(shards) - len(missing), len(missing), len(_ENDPOINTS),
     )
 
+    tasks = queue.Queue()
+    for i in missing:
+        tasks.put(i)
+    done = threading.Event()
+
+    def worker(ep_idx):
+        try:
+            while not done.is_set():
+                try:
+                    i = tasks.get_nowait()
+                except queue.Empty:
+                    break
+                tables[i] = _fetch_shard(shards[i], ep_idx)
+        except BaseException:
+            # 他のワーカーが残りのシャードを取り続けないようにする
+            done.set()
+            raise
+
+    with ThreadPoolExecutor(max_workers=len(_ENDPOINTS)) as executor:
+        futures = [executor.submit(worker, i) for i in range(len(_ENDPOINTS))]
+        for future in futures:
+            future.result()
+
+    failed = [cell for cell, table in zip(shards, tables) if table is None]
+    table = _concat_tables(t for t in tables if t is not None)
     logger.info(
-        "一括取得モード: bbox=(%.3f,%.3f,%.3f,%.3f), %d 地点",
-        *bbox, len(stations),
+        "一括取得完了: %d 施設 (%d シャード成功 / %d 失敗)",
+        len(table["uids"]), len(shards) - len(failed), len(failed),
     )
 
-    # 全施設を一括取得
-    query = _build_bulk_query(bbox, timeout=180)
-    data = _execute_query(query, endpoint_idx=0, timeout=_BULK_TIMEOUT)
+    # 各施設をエリアに割り当て
+    results = _assign_facilities_vectorized(stations, table, radius_m, count_mode)
+
+    if failed:
+        bounds = _padded_bounds(stations, radius_m)
+        retry_mask = np.zeros(len(stations), dtype=bool)
+        for cell in failed:
+            retry_mask |= _points_in_bbox(bounds, _cell_bbox(cell))
+        retry_idx = np.flatnonzero(retry_mask).tolist()
+        logger.warning("失敗シャードに重なる %d 地点をバッチモードで再取得", len(retry_idx))
+        retry_results = _fetch_batches_parallel(
+            [stations[i] for i in retry_idx], radius_m, count_mode
+        )
+        for i, counts in zip(retry_idx, retry_results):
+            results[i] = counts
 
-    if data is None:
-        logger.error("一括クエリ失敗 — 全エリアゼロを返します")
-        return [_zero_counts() for _ in stations]
+    return results
+
+
+def fetch_bulk_facilities(stations, radius_m=STATION_RADIUS_M, count_mode="nearest"):
+    """
+    全地点の施設数を一括モード（シャード分割 bbox 取得 + ローカル割り当て）で取得。
 
-    elements = data.get("elements", [])
-    logger.info("一括取得完了: %d 施設", len(elements))
+    Args:
+        stations: [{"lat": float, "lng": float, ...}, ...] のリスト
+        radius_m: 検索半径（メートル）
+        count_mode: "nearest" / "radius"（モジュール docstring 参照）
 
-    # 各施設を最寄りエリアに割り当て
-    return _assign_facilities_vectorized(stations, elements, radius_m)
+    Returns:
+        施設カウント dict のリスト（stations と同じ順序）
+    """
+    if not stations:
+        return []
+    return _fetch_bulk(stations, radius_m, count_mode)
 
 
 # ── バッチモード（少数地点向け、後方互換）─────────────────
@@ -281,69 +653,425 @@ def _build_batch_query(stations_batch, radius_m):
     return f"[out:json][timeout:90];\n(\n{body}\n);\nout center tags;"
 
 
-def _assign_elements_to_stations(elements, stations_batch, radius_m):
-    """レスポンスの各要素を最寄り駅に帰属させてカウント。"""
-    results = [_zero_counts() for _ in stations_batch]
+def _point_key(station):
+    """地点のキャッシュキー（検索半径は含めず、保存した radius で再利用可否を判定する）"""
+    return f"point/{station['lat']:.6f},{station['lng']:.6f}"
 
-    for el in elements:
-        elat, elng = _get_element_coords(el)
-        ftype = _classify_element(el)
-        if elat is None or ftype is None:
+
+def _cached_point_tables(stations_batch, radius_m):
+    """
+    バッチの各地点について、同じか大きい半径で取得済みの施設テーブルを集める。
+
+    キャッシュは地点ごとなので、バッチの区切りが前回と違っても地点単位で使い回せる。
+    around クエリの結果は半径について単調なので、大きい半径で取得した施設を
+    集計時の距離判定で絞れば、その半径で取得した場合と同じ結果になる。
+
+    Returns:
+        (キャッシュにあった地点の施設テーブルのリスト, キャッシュになかった地点の番号のリスト)
+    """
+    tables = []
+    missing = []
+    for j, station in enumerate(stations_batch):
+        table = _cache_get(_point_key(station))
+        if table is None or int(table["radius"]) < int(radius_m):
+            missing.append(j)
+        else:
+            tables.append(table)
+    return tables, missing
+
+
+def _store_batch_table(stations_batch, radius_m, data):
+    """
+    バッチのレスポンスを施設テーブルにし、地点ごとに半径内の施設を切り出してキャッシュに保存。
+
+    集計は施設の中心座標と地点の距離で行うので、どの地点からも半径外の施設は
+    集計に使われない。地点ごとの切り出しを合わせれば、集計結果はバッチ全体と同じになる。
+    """
+    table = _facility_table(data.get("elements", []))
+    index = GridIndex(
+        [s["lat"] for s in stations_batch], [s["lng"] for s in stations_batch], cell_m=radius_m
+    )
+    fac_idx, point_idx, _ = index.query_radius(table["lats"], table["lngs"], radius_m)
+    order = np.argsort(point_idx, kind="stable")
+    bounds = np.searchsorted(point_idx[order], np.arange(len(stations_batch) + 1))
+    for j, station in enumerate(stations_batch):
+        rows = fac_idx[order[bounds[j] : bounds[j + 1]]]
+        _cache_put(
+            _point_key(station), {k: table[k][rows] for k in _TABLE_COLUMNS}, radius=int(radius_m)
+        )
+    return table
+
+
+def _query_batch_table(stations_batch, radius_m, endpoint_idx=0):
+    """バッチの around クエリを（リトライ付きで）実行して施設テーブルを返す。失敗なら None"""
+    data = _execute_query(_build_batch_query(stations_batch, radius_m), endpoint_idx)
+    if data is None:
+        return None
+    return _store_batch_table(stations_batch, radius_m, data)
+
+
+def _load_batch_stats():
+    """バッチサイズ調整の統計を読み込む（なければ空）"""
+    if not _BATCH_STATS_PATH.exists():
+        return {}
+    with open(_BATCH_STATS_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_batch_stats(stats):
+    """統計を書き込む（書き込み途中で壊れないよう一時ファイル経由）"""
+    _BATCH_STATS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = _BATCH_STATS_PATH.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, _BATCH_STATS_PATH)
+
+
+def _plan_batches(stations, cell_sizes):
+    """
+    地点を geohash セルごとにまとめ、セルのバッチサイズで区切ったバッチに分ける。
+
+    Args:
+        cell_sizes: {geohash セル: バッチサイズ}（ないセルは _BATCH_SIZE）
+
+    Returns:
+        [(セル, 地点番号のリスト), ...]。セル内は geohash 順なので近い地点が同じバッチに入る
+    """
+    fine = geohash_np(
+        [s["lat"] for s in stations], [s["lng"] for s in stations], _BATCH_CELL_PRECISION + 2
+    )
+    order = np.argsort(fine, kind="stable")
+    batches = []
+    start = 0
+    while start < len(order):
+        cell = fine[order[start]][:_BATCH_CELL_PRECISION]
+        end = start
+        while end < len(order) and fine[order[end]].startswith(cell):
+            end += 1
+        size = cell_sizes.get(cell, _BATCH_SIZE)
+        for i in range(start, end, size):
+            batches.append((cell, order[i : min(i + size, end)].tolist()))
+        start = end
+    return batches
+
+
+def _next_batch_size(size, obs):
+    """
+    1セルの観測値から次回のバッチサイズを決める。
+
+    地点あたりの応答時間・要素数から目標値に収まるサイズを見積もり、
+    現在のサイズとの平均を取る（急に変えない）。タイムアウトがあれば半分以下にする。
+
+    Args:
+        size: 今回のバッチサイズ
+        obs: {"requests", "timeouts", "points", "latency_s", "elements"}
+            （points / latency_s / elements は成功したリクエストの合計）
+    """
+    new = size
+    if obs["points"] > 0:
+        latency_per_point = max(obs["latency_s"] / obs["points"], 1e-3)
+        elements_per_point = max(obs["elements"] / obs["points"], 1e-3)
+        estimate = min(
+            _BATCH_TARGET_LATENCY_S / latency_per_point,
+            _BATCH_TARGET_ELEMENTS / elements_per_point,
+        )
+        new = round((size + estimate) / 2)
+    if obs["timeouts"]:
+        new = min(new, size // 2)
+    return int(min(_BATCH_SIZE_MAX, max(_BATCH_SIZE_MIN, new)))
+
+
+def _update_batch_stats(stats, radius_key, cell_sizes, observations, summary):
+    """今回の観測値でセルごとのバッチサイズと統計を更新する"""
+    cells = stats.setdefault(radius_key, {}).setdefault("cells", {})
+    grown = shrunk = 0
+    for cell, obs in observations.items():
+        if obs["requests"] == 0:
             continue
+        size = cell_sizes.get(cell, _BATCH_SIZE)
+        new = _next_batch_size(size, obs)
+        grown += new > size
+        shrunk += new < size
+        cells[cell] = {
+            "batch_size": new,
+            "requests": obs["requests"],
+            "timeouts": obs["timeouts"],
+            "points": obs["points"],
+            "latency_s": round(obs["latency_s"], 3),
+            "elements": obs["elements"],
+        }
+    stats[radius_key]["last_run"] = {
+        **summary,
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    logger.info(
+        "バッチサイズ調整: %d セル (拡大 %d / 縮小 %d) — リクエスト %d 回, タイムアウト %d 回",
+        len(observations), grown, shrunk, summary["requests"], summary["timeouts"],
+    )
 
-        min_dist = float("inf")
-        nearest_idx = -1
-        for idx, s in enumerate(stations_batch):
-            d = _haversine_m(elat, elng, s["lat"], s["lng"])
-            if d < min_dist and d <= radius_m:
-                min_dist = d
-                nearest_idx = idx
 
-        if nearest_idx >= 0:
-            results[nearest_idx][ftype] += 1
+def _fetch_batches_parallel(stations, radius_m, count_mode="nearest", on_batch=None):
+    """
+    バッチモード: 地点をバッチに分け、エンドポイントごとのワーカーで並列取得。
 
-    return results
+    バッチは geohash セルごとに、前回までの統計から決めたサイズで区切る（_plan_batches）。
+    実行中にタイムアウトしたバッチはその場で半分に分割して取り直し、
+    終了時にセルごとの応答時間・要素数・タイムアウト数から次回のサイズを更新する。
+    キャッシュは地点ごとなので、バッチの区切りや検索半径が前回と違っても取得済みの地点は
+    使い回し、バッチのうちキャッシュにない地点だけをクエリする。
 
+    各ワーカーは共有キューからバッチを取り出し、担当エンドポイント専用の AIMD レートリミッタ
+    （lib.rate_limit.AdaptiveTokenBucket）に従ってクエリを1回ずつ送る。
+    失敗したバッチはキューに戻して空いているワーカーに回すので、遅い・制限中の
+    エンドポイントが他を止めることはない。_MAX_RETRIES 回失敗したバッチはゼロとする。
+    全地点がキャッシュ済みのバッチはリクエストを送らずに集計する。
 
-def _fetch_batch_sequential(stations, radius_m):
-    """バッチモード: 少数地点を個別クエリで取得（従来方式）"""
-    total = len(stations)
-    num_batches = math.ceil(total / _BATCH_SIZE)
+    Args:
+        stations: [{"lat": float, "lng": float, ...}, ...] のリスト
+        radius_m: 検索半径（メートル）
+        count_mode: "nearest" / "radius"（モジュール docstring 参照）
+        on_batch: バッチ完了ごとに on_batch(バッチの地点リスト, 施設カウントのリスト) を呼ぶ。
+            ワーカースレッドから呼ばれるが、同時に呼ばれることはない
+
+    Returns:
+        施設カウント dict のリスト（stations と同じ順序）
+    """
+    if not stations:
+        return []
+
+    stats = _load_batch_stats()
+    radius_key = str(int(radius_m))
+    cell_sizes = {
+        cell: entry["batch_size"]
+        for cell, entry in stats.get(radius_key, {}).get("cells", {}).items()
+    }
+    planned = _plan_batches(stations, cell_sizes)
     logger.info(
-        "バッチ取得モード: %d地点 → %dバッチ (各%d地点, %ds間隔)",
-        total, num_batches, _BATCH_SIZE, _BATCH_DELAY,
+        "バッチ取得モード: %d地点 → %dバッチ (%d セル, 平均 %.1f 地点/バッチ, %d エンドポイント並列)",
+        len(stations), len(planned), len({cell for cell, _ in planned}),
+        len(stations) / len(planned), len(_ENDPOINTS),
     )
 
-    all_results = []
-    for batch_idx in range(num_batches):
-        start = batch_idx * _BATCH_SIZE
-        end = min(start + _BATCH_SIZE, total)
-        batch = stations[start:end]
+    tasks = queue.Queue()
+    for cell, idx in planned:
+        tasks.put((cell, idx, 0))
+    results = [None] * len(stations)
+    lock = threading.Lock()
+    done = threading.Event()
+    remaining = [len(stations)]  # 未完了の地点数（バッチは分割されうるので地点数で数える）
+    observations = {}
+    summary = {"batches": len(planned), "requests": 0, "timeouts": 0, "cache_hits": 0}
+
+    def stop():
+        # 待機中のワーカーを番兵で起こして終了させる
+        done.set()
+        for _ in _ENDPOINTS:
+            tasks.put(None)
+
+    def observe(cell, n_points, latency_s, elements, timed_out):
+        with lock:
+            obs = observations.setdefault(
+                cell, {"requests": 0, "timeouts": 0, "points": 0, "latency_s": 0.0, "elements": 0}
+            )
+            obs["requests"] += 1
+            summary["requests"] += 1
+            if timed_out:
+                obs["timeouts"] += 1
+                summary["timeouts"] += 1
+            elif elements is not None:
+                obs["points"] += n_points
+                obs["latency_s"] += latency_s
+                obs["elements"] += elements
+
+    def finish(idx, counts):
+        with lock:
+            for i, c in zip(idx, counts):
+                results[i] = c
+            if on_batch is not None:
+                on_batch([stations[i] for i in idx], counts)
+            remaining[0] -= len(idx)
+            processed = len(stations) - remaining[0]
+            if remaining[0] == 0 or processed // 100 != (processed - len(idx)) // 100:
+                logger.info("Overpass 進捗: %d / %d 地点", processed, len(stations))
+            if remaining[0] == 0:
+                stop()
+
+    def worker(ep_idx):
+        limiter = AdaptiveTokenBucket(
+            1 / _BATCH_DELAY,
+            min_rate=_WORKER_MIN_RATE,
+            max_rate=_WORKER_MAX_RATE,
+            increase=_WORKER_RATE_STEP,
+        )
+        try:
+            while not done.is_set():
+                task = tasks.get()
+                if task is None:
+                    break
+                cell, idx, attempts = task
+                batch = [stations[i] for i in idx]
+
+                tables, missing = _cached_point_tables(batch, radius_m)
+                timed_out = False
+                if not missing:
+                    with lock:
+                        summary["cache_hits"] += 1
+                else:
+                    # キャッシュにない地点だけをクエリする
+                    query_batch = [batch[j] for j in missing]
+                    limiter.acquire()
+                    started = time.monotonic()
+                    data, timed_out = _query_once(_build_batch_query(query_batch, radius_m), ep_idx)
+                    latency_s = time.monotonic() - started
+                    if data is None:
+                        limiter.on_throttle()
+                        observe(cell, len(missing), latency_s, None, timed_out)
+                        tables = None
+                    else:
+                        limiter.on_success()
+                        observe(cell, len(missing), latency_s, len(data.get("elements", [])), False)
+                        tables.append(_store_batch_table(query_batch, radius_m, data))
+
+                if tables is not None:
+                    table = _concat_tables(tables)
+                    finish(idx, _count_table(batch, table, radius_m, count_mode))
+                elif timed_out and len(idx) > 1:
+                    # クエリが重すぎるので半分に分けて取り直す（試行回数は数えない）
+                    half = len(idx) // 2
+                    logger.debug("バッチを分割して再キュー (%s: %d 地点)", cell, len(idx))
+                    tasks.put((cell, idx[:half], attempts))
+                    tasks.put((cell, idx[half:], attempts))
+                elif attempts + 1 < _MAX_RETRIES:
+                    logger.debug(
+                        "バッチを再キュー (%s: %d/%d, %s は %.3f req/s に減速)",
+                        cell, attempts + 1, _MAX_RETRIES, _ENDPOINTS[ep_idx], limiter.rate,
+                    )
+                    tasks.put((cell, idx, attempts + 1))
+                else:
+                    logger.warning("バッチクエリ失敗 (%d駅) — ゼロを返します", len(idx))
+                    finish(idx, [_zero_counts() for _ in idx])
+        except BaseException:
+            # コールバック等の例外で他のワーカーが待ち続けないようにする
+            stop()
+            raise
+
+    with ThreadPoolExecutor(max_workers=len(_ENDPOINTS)) as executor:
+        futures = [executor.submit(worker, i) for i in range(len(_ENDPOINTS))]
+        for future in futures:
+            future.result()
+
+    _update_batch_stats(stats, radius_key, cell_sizes, observations, summary)
+    _save_batch_stats(stats)
+    return results
+
+
+# ── ローカル抽出モード（.osm.pbf）─────────────────────
+
+# .osm.pbf から抽出した施設テーブルのキャッシュ（data/cache/osm_facilities/<pbf名>.npz）
+_OSM_FACILITY_CACHE_DIR = (
+    Path(__file__).resolve().parent.parent / "data" / "cache" / "osm_facilities"
+)
 
-        if batch_idx > 0:
-            time.sleep(_BATCH_DELAY)
+# _classify_element が参照するタグキー
+_FACILITY_TAG_KEYS = ("amenity", "shop", "leisure")
 
-        ep_idx = batch_idx % len(_ENDPOINTS)
-        query = _build_batch_query(batch, radius_m)
-        data = _execute_query(query, ep_idx)
 
-        if data is None:
-            logger.warning("バッチクエリ失敗 (%d駅) — ゼロを返します", len(batch))
-            all_results.extend([_zero_counts() for _ in batch])
+def _import_osmium():
+    """pyosmium を遅延 import する（ローカル抽出モードでのみ必要）"""
+    try:
+        import osmium
+    except ImportError as e:
+        raise ImportError(
+            "ローカル OSM 抽出の読み込みには pyosmium が必要です（pip install osmium）"
+        ) from e
+    return osmium
+
+
+def _extract_pbf_facilities(pbf_path):
+    """
+    .osm.pbf をストリーム読み込みし、_classify_element が数える施設だけを列データにする。
+
+    Overpass の `nw[...]; out center;` と同じく node と way を対象にし、
+    way の座標は構成ノードの bbox 中心（Overpass の center と同じ定義）とする。
+
+    Returns:
+        (lats, lngs, categories) の numpy 配列。categories は _CATEGORIES の番号
+    """
+    osmium = _import_osmium()
+    cat_index = {c: i for i, c in enumerate(_CATEGORIES)}
+    lats = []
+    lngs = []
+    cats = []
+
+    # way の座標解決のため全ノードの位置を保持し、タグキーで対象を絞ってから Python に渡す
+    processor = (
+        osmium.FileProcessor(str(pbf_path), osmium.osm.NODE | osmium.osm.WAY)
+        .with_locations()
+        .with_filter(osmium.filter.KeyFilter(*_FACILITY_TAG_KEYS))
+    )
+    for obj in processor:
+        tags = {k: obj.tags.get(k, "") for k in _FACILITY_TAG_KEYS}
+        ftype = _classify_element({"tags": tags})
+        if ftype is None:
+            continue
+
+        if obj.is_node():
+            if not obj.location.valid():
+                continue
+            lat, lng = obj.location.lat, obj.location.lon
         else:
-            elements = data.get("elements", [])
-            all_results.extend(
-                _assign_elements_to_stations(elements, batch, radius_m)
-            )
+            locs = [n.location for n in obj.nodes if n.location.valid()]
+            if not locs:
+                continue
+            node_lats = [loc.lat for loc in locs]
+            node_lngs = [loc.lon for loc in locs]
+            lat = (min(node_lats) + max(node_lats)) / 2
+            lng = (min(node_lngs) + max(node_lngs)) / 2
 
-        processed = start + len(batch)
-        if (batch_idx + 1) % 5 == 0 or processed == total:
-            logger.info(
-                "Overpass 進捗: %d / %d 地点 (バッチ %d/%d)",
-                processed, total, batch_idx + 1, num_batches,
-            )
+        lats.append(lat)
+        lngs.append(lng)
+        cats.append(cat_index[ftype])
 
-    return all_results
+    return (
+        np.array(lats, dtype=float),
+        np.array(lngs, dtype=float),
+        np.array(cats, dtype=np.int64),
+    )
+
+
+def load_pbf_facilities(pbf_path, refresh=False):
+    """
+    .osm.pbf から施設テーブルを読み込む。
+
+    抽出結果は data/cache/osm_facilities に npz（緯度・経度・カテゴリの列）で保存し、
+    pbf より新しいキャッシュがあれば pbf を読まずにそれを使う。
+
+    Args:
+        pbf_path: .osm.pbf ファイルのパス
+        refresh: True ならキャッシュを使わずに抽出し直す
+
+    Returns:
+        (lats, lngs, categories) の numpy 配列
+    """
+    pbf_path = Path(pbf_path)
+    cache_path = _OSM_FACILITY_CACHE_DIR / f"{pbf_path.name}.npz"
+
+    if (
+        not refresh
+        and cache_path.exists()
+        and cache_path.stat().st_mtime >= pbf_path.stat().st_mtime
+    ):
+        with np.load(cache_path) as data:
+            table = (data["lats"], data["lngs"], data["cats"].astype(np.int64))
+        logger.info("OSM 施設テーブルをキャッシュから読み込み: %d 件 (%s)", len(table[0]), cache_path)
+        return table
+
+    logger.info("OSM 抽出を読み込み中: %s", pbf_path)
+    lats, lngs, cats = _extract_pbf_facilities(pbf_path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(cache_path, lats=lats, lngs=lngs, cats=cats.astype(np.int8))
+    logger.info("OSM 施設テーブルを保存: %d 件 (%s)", len(lats), cache_path)
+    return lats, lngs, cats
 
 
 # ── 公開 API ─────────────────────────────────────────
@@ -352,24 +1080,45 @@ def _fetch_batch_sequential(stations, radius_m):
 def fetch_station_facilities(lat, lng, radius_m=STATION_RADIUS_M):
     """単一駅の施設数を取得（後方互換）"""
     batch = [{"lat": lat, "lng": lng}]
-    results = _fetch_batch_sequential(batch, radius_m)
+    results = _fetch_batches_parallel(batch, radius_m)
     return results[0]
 
 
-def fetch_batch_facilities(stations_batch, radius_m=STATION_RADIUS_M, endpoint_idx=0):
-    """バッチ内の複数駅の施設数を1クエリで取得（後方互換）"""
-    query = _build_batch_query(stations_batch, radius_m)
-    data = _execute_query(query, endpoint_idx)
+def fetch_batch_facilities(
+    stations_batch, radius_m=STATION_RADIUS_M, endpoint_idx=0, count_mode="nearest"
+):
+    """バッチ内の複数駅の施設数を1クエリで取得（取得済みの地点はキャッシュを使う、後方互換）"""
+    tables, missing = _cached_point_tables(stations_batch, radius_m)
+    if missing:
+        table = _query_batch_table([stations_batch[j] for j in missing], radius_m, endpoint_idx)
+        if table is None:
+            logger.warning("バッチクエリ失敗 (%d駅) — 全駅ゼロを返します", len(stations_batch))
+            return [_zero_counts() for _ in stations_batch]
+        tables.append(table)
 
-    if data is None:
-        logger.warning("バッチクエリ失敗 (%d駅) — 全駅ゼロを返します", len(stations_batch))
-        return [_zero_counts() for _ in stations_batch]
+    return _count_table(stations_batch, _concat_tables(tables), radius_m, count_mode)
+
+
+def fetch_facilities_in_batches(
+    stations, radius_m=STATION_RADIUS_M, count_mode="nearest", on_batch=None
+):
+    """
+    全地点の施設数をバッチモード（エンドポイント並列の around クエリ）で取得。
 
-    elements = data.get("elements", [])
-    return _assign_elements_to_stations(elements, stations_batch, radius_m)
+    Args:
+        stations: [{"lat": float, "lng": float, ...}, ...] のリスト
+        radius_m: 検索半径（メートル）
+        count_mode: "nearest" / "radius"（モジュール docstring 参照）
+        on_batch: バッチ完了ごとに on_batch(バッチの地点リスト, 施設カウントのリスト) を呼ぶ
+            （逐次 DB 書き込み用。同時に呼ばれることはない）
+
+    Returns:
+        施設カウント dict のリスト（stations と同じ順序）
+    """
+    return _fetch_batches_parallel(stations, radius_m, count_mode, on_batch)
 
 
-def fetch_all_stations_facilities(stations, radius_m=STATION_RADIUS_M):
+def fetch_all_stations_facilities(stations, radius_m=STATION_RADIUS_M, count_mode="nearest"):
     """
     全地点の施設数を取得。
 
@@ -380,10 +1129,39 @@ def fetch_all_stations_facilities(stations, radius_m=STATION_RADIUS_M):
     Args:
         stations: [{"lat": float, "lng": float, ...}, ...] のリスト
         radius_m: 検索半径（メートル）
+        count_mode: "nearest" / "radius"（モジュール docstring 参照）
 
     Returns:
         施設カウント dict のリスト（stations と同じ順序）
     """
     if len(stations) <= _BULK_THRESHOLD:
-        return _fetch_batch_sequential(stations, radius_m)
-    return _fetch_bulk(stations, radius_m)
+        return _fetch_batches_parallel(stations, radius_m, count_mode)
+    return _fetch_bulk(stations, radius_m, count_mode)
+
+
+def fetch_local_facilities(
+    stations, pbf_path, radius_m=STATION_RADIUS_M, count_mode="nearest", refresh=False
+):
+    """
+    ローカルの .osm.pbf 抽出から全地点の施設数を集計（Overpass API を使わない）。
+
+    Args:
+        stations: [{"lat": float, "lng": float, ...}, ...] のリスト
+        pbf_path: 対象地域を含む .osm.pbf ファイルのパス
+        radius_m: 検索半径（メートル）
+        count_mode: "nearest" / "radius"（モジュール docstring 参照）
+        refresh: True なら施設テーブルのキャッシュを使わずに抽出し直す
+
+    Returns:
+        施設カウント dict のリスト（stations と同じ順序）
+    """
+    if not stations:
+        return []
+    fac_lats, fac_lngs, fac_cats = load_pbf_facilities(pbf_path, refresh)
+    logger.info(
+        "施設データ: %d 件を %d エリアに集計中 (count_mode=%s)...",
+        len(fac_lats), len(stations), count_mode,
+    )
+    matrix = _count_facilities(stations, fac_lats, fac_lngs, fac_cats, radius_m, count_mode)
+    logger.info("施設集計完了: 延べ %d 件", int(matrix.sum()))
+    return _counts_from_matrix(matrix)
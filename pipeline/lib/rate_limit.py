@@ -0,0 +1,110 @@
+"""
+レート制限
+複数スレッドで共有するトークンバケット（固定レート / AIMD による適応レート）
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    トークンバケット方式のレートリミッタ（スレッドセーフ）。
+
+    rate 個/秒でトークンが補充され、最大 burst 個まで貯まる。
+    acquire() はトークンが取れるまでブロックする。
+    固定 sleep と違い、待ち時間はリクエスト時間と重ねて消化される。
+
+    使用例:
+        limiter = TokenBucket(rate=2.0, burst=4)
+        limiter.acquire()
+        requests.get(...)
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+            rate: 1秒あたりのトークン補充数（= 許容リクエスト数/秒）
+            burst: 貯められるトークンの最大数（瞬間的に連続で許容するリクエスト数）
+        """
+        if rate <= 0:
+            raise ValueError("rate は正の値を指定してください")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> None:
+        """トークンを1つ消費する。足りなければ補充されるまで待つ"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    AIMD（加算増加・乗算減少）でレートを自動調整するトークンバケット（スレッドセーフ）。
+
+    リクエスト成功ごとに on_success() で rate を increase だけ上げ、
+    429 / 504 / タイムアウトなどで on_throttle() を呼ぶと rate を decrease 倍に下げる。
+    サーバー側の制限値が分からない API でも、制限の手前のレートに収束する。
+
+    使用例:
+        limiter = AdaptiveTokenBucket(rate=0.2, min_rate=0.01, max_rate=0.5)
+        limiter.acquire()
+        resp = requests.post(...)
+        if resp.status_code == 429:
+            limiter.on_throttle()
+        else:
+            limiter.on_success()
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int = 1,
+        min_rate: float | None = None,
+        max_rate: float | None = None,
+        increase: float | None = None,
+        decrease: float = 0.5,
+    ):
+        """
+        Args:
+            rate: 初期レート（リクエスト数/秒）
+            burst: 貯められるトークンの最大数
+            min_rate: レートの下限（デフォルト: rate の 1/10）
+            max_rate: レートの上限（デフォルト: rate の 4 倍）
+            increase: 成功1回あたりのレート増分（デフォルト: rate の 1/10）
+            decrease: スロットリング時にレートに掛ける係数（0〜1）
+        """
+        super().__init__(rate, burst)
+        if not 0 < decrease < 1:
+            raise ValueError("decrease は 0 より大きく 1 より小さい値を指定してください")
+        self.min_rate = min_rate if min_rate is not None else rate / 10
+        self.max_rate = max_rate if max_rate is not None else rate * 4
+        self.increase = increase if increase is not None else rate / 10
+        self.decrease = decrease
+
+    def on_success(self) -> None:
+        """リクエスト成功: レートを increase だけ上げる"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self) -> None:
+        """スロットリング: レートを decrease 倍に下げ、貯まったトークンも捨てる"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = min(self._tokens, 0.0)
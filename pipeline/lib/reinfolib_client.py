@@ -2,25 +2,47 @@
 不動産情報ライブラリ API クライアント
 
 各駅周辺の洪水・土砂・津波・液状化リスク情報を取得する。
+多地点をまとめて処理する場合は fetch_hazard_batch を使うと、
+地点間で共有するタイルを1回ずつしか取得しない。
 
 API ドキュメント: https://www.reinfolib.mlit.go.jp/
 """
 
+import json
 import logging
 import math
+import threading
 import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 from typing import Any, Optional
 
+import numpy as np
 import requests
-from shapely.geometry import Point, shape
+import shapely
+from shapely.geometry import shape
+
+from config.settings import (
+    REINFOLIB_CONCURRENCY,
+    REINFOLIB_REQUESTS_PER_SEC,
+    REINFOLIB_TILE_CACHE_MAX_MB,
+    REINFOLIB_TILE_CACHE_TTL_DAYS,
+)
+from lib.disk_cache import DiskCache
+from lib.rate_limit import TokenBucket
 
 logger = logging.getLogger(__name__)
 
 # API ベース URL
 _BASE_URL = "https://www.reinfolib.mlit.go.jp/ex-api/external"
 
-# レート制限: リクエスト間隔（秒）
-_REQUEST_DELAY = 0.5
+# レート制限: 全エンドポイント・全スレッドで共有するトークンバケット
+# （リトライを含む API 呼び出しごとに1トークン消費。キャッシュヒットは消費しない）
+_rate_limiter = TokenBucket(REINFOLIB_REQUESTS_PER_SEC, burst=REINFOLIB_CONCURRENCY)
+
+# スレッドごとの HTTP セッション（keep-alive で接続を使い回す）
+_thread_local = threading.local()
 
 # リトライ設定
 _MAX_RETRIES = 3
@@ -31,6 +53,29 @@ _DEFAULT_ZOOM = 15
 # タイルサイズ（Web Mercator）
 _TILE_SIZE = 256
 
+# 災害種別 → API エンドポイント
+HAZARD_ENDPOINTS = {
+    "flood": "XKT026",
+    "landslide": "XKT029",
+    "tsunami": "XKT028",
+    "liquefaction": "XKT025",
+}
+
+# バッチ取得時の進捗ログ間隔（タイル数）
+_PROGRESS_INTERVAL = 200
+
+# 検索円を近似する多角形の頂点数
+_CIRCLE_SEGMENTS = 64
+
+# タイルのディスクキャッシュ（キー: endpoint/z/x/y、値: zlib 圧縮したフィーチャー一覧の JSON）
+# 隣接駅や再実行で同じタイルを何度も取得しないようにする
+_TILE_CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "cache" / "reinfolib_tiles"
+_tile_cache = DiskCache(
+    _TILE_CACHE_DIR,
+    ttl_s=REINFOLIB_TILE_CACHE_TTL_DAYS * 86400,
+    max_bytes=REINFOLIB_TILE_CACHE_MAX_MB * 1024 * 1024,
+)
+
 
 def lat_lng_to_tile(lat: float, lng: float, zoom: int) -> tuple[int, int]:
     """
@@ -70,21 +115,51 @@ def get_covering_tiles(
     lat_deg = radius_m / 111_320
     lng_deg = radius_m / (111_320 * math.cos(math.radians(lat)))
 
-    corners = [
-        (lat + lat_deg, lng - lng_deg),  # NW
-        (lat + lat_deg, lng + lng_deg),  # NE
-        (lat - lat_deg, lng - lng_deg),  # SW
-        (lat - lat_deg, lng + lng_deg),  # SE
+    return _tiles_in_bbox(lng - lng_deg, lat - lat_deg, lng + lng_deg, lat + lat_deg, zoom)
+
+
+def _tiles_in_bbox(
+    min_lng: float, min_lat: float, max_lng: float, max_lat: float, zoom: int
+) -> list[tuple[int, int]]:
+    """
+    バウンディングボックスと重なるタイルをすべて返す。
+    NW / SE の角のタイルの間の矩形をすべて含める
+    （角と中心だけだと、範囲がタイル幅を超えるときに辺の中央のタイルが抜ける）。
+    """
+    x_min, y_min = lat_lng_to_tile(max_lat, min_lng, zoom)
+    x_max, y_max = lat_lng_to_tile(min_lat, max_lng, zoom)
+
+    return [
+        (tx, ty)
+        for tx in range(x_min, x_max + 1)
+        for ty in range(y_min, y_max + 1)
     ]
 
+
+def plan_tiles(geometries, zoom: int = _DEFAULT_ZOOM) -> list[tuple[int, int]]:
+    """
+    複数ジオメトリ（検索円やエリアのポリゴン）をカバーするタイルの和集合を返す。
+
+    Args:
+        geometries: shapely ジオメトリの配列（経度・緯度）
+        zoom: ズームレベル
+
+    Returns:
+        [(tile_x, tile_y), ...]（重複なし・ソート済み）
+    """
     tiles = set()
-    for c_lat, c_lng in corners:
-        tiles.add(lat_lng_to_tile(c_lat, c_lng, zoom))
+    for min_lng, min_lat, max_lng, max_lat in shapely.bounds(geometries).tolist():
+        tiles.update(_tiles_in_bbox(min_lng, min_lat, max_lng, max_lat, zoom))
+    return sorted(tiles)
 
-    # 中心タイルも確実に含める
-    tiles.add(lat_lng_to_tile(lat, lng, zoom))
 
-    return list(tiles)
+def _get_session() -> requests.Session:
+    """呼び出し元スレッド専用の requests.Session を返す"""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _thread_local.session = session
+    return session
 
 
 def _api_request(
@@ -93,18 +168,20 @@ def _api_request(
     z: int,
     x: int,
     y: int,
-) -> list[dict[str, Any]]:
+) -> Optional[list[dict[str, Any]]]:
     """
     不動産情報ライブラリ API を呼び出し、GeoJSON フィーチャー一覧を返す。
-    リトライ（指数バックオフ）付き。
+    リトライ（指数バックオフ）付き。全リトライ失敗時は None。
     """
     url = f"{_BASE_URL}/{endpoint}"
     headers = {"Ocp-Apim-Subscription-Key": api_key}
     params = {"response_format": "geojson", "z": z, "x": x, "y": y}
+    session = _get_session()
 
     for attempt in range(_MAX_RETRIES):
+        _rate_limiter.acquire()
         try:
-            resp = requests.get(url, headers=headers, params=params, timeout=30)
+            resp = session.get(url, headers=headers, params=params, timeout=30)
             resp.raise_for_status()
             data = resp.json()
             return data.get("features", [])
@@ -114,12 +191,50 @@ def _api_request(
                     "API リクエスト失敗 %s (z=%d,x=%d,y=%d): %s",
                     endpoint, z, x, y, e,
                 )
-                return []
+                return None
             wait = 2 ** attempt
             logger.debug("リトライ %d/%d (%ds後): %s", attempt + 1, _MAX_RETRIES, wait, e)
             time.sleep(wait)
 
-    return []
+    return None
+
+
+def _fetch_tile(
+    endpoint: str, api_key: str, z: int, x: int, y: int
+) -> list[dict[str, Any]]:
+    """
+    1タイル分のフィーチャー一覧を返す。
+    ディスクキャッシュにあればそれを使い、なければ API を呼んで保存する。
+    レート制限の待機は API を呼んだときだけ行う。失敗したタイルはキャッシュしない。
+    """
+    key = f"{endpoint}/{z}/{x}/{y}"
+    cached = _tile_cache.get(key)
+    if cached is not None:
+        return json.loads(zlib.decompress(cached))
+
+    features = _api_request(endpoint, api_key, z, x, y)
+    if features is None:
+        return []
+
+    payload = json.dumps(features, ensure_ascii=False, separators=(",", ":"))
+    _tile_cache.put(key, zlib.compress(payload.encode("utf-8")))
+    return features
+
+
+def clear_tile_cache() -> int:
+    """タイルキャッシュを全削除し、削除件数を返す"""
+    return _tile_cache.clear()
+
+
+def log_tile_cache_stats() -> None:
+    """タイルキャッシュのヒット率をログ出力"""
+    stats = _tile_cache.stats()
+    total = stats["hits"] + stats["misses"]
+    if total:
+        logger.info(
+            "タイルキャッシュ: %d / %d ヒット (%.0f%%)",
+            stats["hits"], total, stats["hits"] / total * 100,
+        )
 
 
 def _fetch_features_in_radius(
@@ -134,40 +249,110 @@ def _fetch_features_in_radius(
     指定座標の半径内にあるフィーチャーを全タイルから取得し、
     空間交差判定でフィルタリングして返す。
     """
-    center = Point(lng, lat)
-    # メートル → 度（概算）でバッファ
-    buffer_deg = radius_m / 111_320
-    search_area = center.buffer(buffer_deg)
+    search_area = search_areas([lat], [lng], radius_m)[0]
 
     tiles = get_covering_tiles(lat, lng, radius_m, zoom)
     all_features = []
 
     for tx, ty in tiles:
-        features = _api_request(endpoint, api_key, zoom, tx, ty)
-        time.sleep(_REQUEST_DELAY)
+        features = _fetch_tile(endpoint, api_key, zoom, tx, ty)
 
-        for f in features:
-            try:
-                geom = shape(f["geometry"])
-                if geom.intersects(search_area):
-                    all_features.append(f)
-            except Exception:
-                continue
+        for geom, f in _parse_features(features):
+            if geom.intersects(search_area):
+                all_features.append(f)
 
     return all_features
 
 
-def fetch_flood_risk(
-    api_key: str, lat: float, lng: float, radius_m: float
-) -> Optional[float]:
+def search_areas(lats, lngs, radius_m: float) -> np.ndarray:
     """
-    洪水浸水想定区域を取得し、最大浸水深（メートル）を返す。
-    浸水リスクなしの場合は None。
+    各地点を中心とする半径 radius_m の検索円をまとめて生成する。
 
-    API: XKT026
+    経度・緯度の座標系で、経度方向の半径を cos(緯度) で補正した楕円になる
+    （度単位でそのままバッファすると東西方向が約 2 割狭くなるため）。
+
+    Returns:
+        shapely Polygon の配列
+    """
+    lats = np.asarray(lats, dtype=float)
+    lngs = np.asarray(lngs, dtype=float)
+    theta = np.linspace(0, 2 * np.pi, _CIRCLE_SEGMENTS, endpoint=False)
+    r_lat = radius_m / 111_320
+    r_lng = r_lat / np.cos(np.radians(lats))
+    xs = lngs[:, None] + r_lng[:, None] * np.cos(theta)
+    ys = lats[:, None] + r_lat * np.sin(theta)
+    return shapely.polygons(np.stack([xs, ys], axis=-1))
+
+
+class FeatureIndex:
     """
-    features = _fetch_features_in_radius("XKT026", api_key, lat, lng, radius_m)
+    1エンドポイント分のフィーチャーを STRtree で索引したもの。
 
+    query() は複数の検索ジオメトリとの交差判定を shapely 2.0 の
+    ベクトル化された STRtree.query でまとめて行う。
+    """
+
+    def __init__(self, parsed: list[tuple[Any, dict[str, Any]]]):
+        """
+        Args:
+            parsed: [(shapely ジオメトリ, フィーチャー), ...]（_parse_features の戻り値）
+        """
+        self.features = [f for _, f in parsed]
+        self.tree = shapely.STRtree([g for g, _ in parsed])
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    def query(self, geometries) -> list[list[dict[str, Any]]]:
+        """
+        各検索ジオメトリと交差するフィーチャーを返す。
+
+        Returns:
+            geometries と同じ順の、交差するフィーチャーのリスト
+        """
+        matched: list[list[dict[str, Any]]] = [[] for _ in range(len(geometries))]
+        query_idx, feature_idx = self.tree.query(geometries, predicate="intersects")
+        for q, f in zip(query_idx.tolist(), feature_idx.tolist()):
+            matched[q].append(self.features[f])
+        return matched
+
+
+def _parse_features(features: list[dict[str, Any]]) -> list[tuple[Any, dict[str, Any]]]:
+    """
+    フィーチャー一覧を (shapely ジオメトリ, フィーチャー) に変換。
+
+    自己交差などで無効なジオメトリは shapely.make_valid で修復する
+    （無効なまま STRtree.query の intersects に渡すと GEOS の例外で全体が失敗する）。
+    変換・修復できないもの、空になるものは除外する。
+    """
+    parsed = []
+    for f in features:
+        try:
+            parsed.append((shape(f["geometry"]), f))
+        except Exception:
+            continue
+    if not parsed:
+        return parsed
+
+    geoms = np.array([g for g, _ in parsed], dtype=object)
+    invalid = ~shapely.is_valid(geoms)
+    if invalid.any():
+        repaired = 0
+        for i in np.flatnonzero(invalid).tolist():
+            try:
+                geoms[i] = shapely.make_valid(geoms[i])
+                repaired += 1
+            except Exception as e:
+                logger.warning("無効なジオメトリを除外: %s", e)
+                geoms[i] = None
+        logger.debug("無効なジオメトリを修復: %d 件", repaired)
+
+    keep = ~shapely.is_missing(geoms) & ~shapely.is_empty(geoms)
+    return [(g, f) for g, (_, f), k in zip(geoms.tolist(), parsed, keep.tolist()) if k]
+
+
+def _max_flood_depth(features: list[dict[str, Any]]) -> Optional[float]:
+    """洪水フィーチャーの最大浸水深（メートル）。浸水リスクなしは None"""
     if not features:
         return None
 
@@ -184,18 +369,8 @@ def fetch_flood_risk(
     return max_depth if max_depth > 0 else None
 
 
-def fetch_landslide_risk(
-    api_key: str, lat: float, lng: float, radius_m: float
-) -> tuple[bool, bool]:
-    """
-    土砂災害警戒区域を取得。
-
-    API: XKT029
-    Returns:
-        (warning: bool, special_warning: bool)
-    """
-    features = _fetch_features_in_radius("XKT029", api_key, lat, lng, radius_m)
-
+def _landslide_zones(features: list[dict[str, Any]]) -> tuple[bool, bool]:
+    """土砂フィーチャーの (警戒区域あり, 特別警戒区域あり)"""
     warning = False
     special = False
 
@@ -212,17 +387,8 @@ def fetch_landslide_risk(
     return warning, special
 
 
-def fetch_tsunami_risk(
-    api_key: str, lat: float, lng: float, radius_m: float
-) -> Optional[float]:
-    """
-    津波浸水想定区域を取得し、最大浸水深（メートル）を返す。
-    津波リスクなしの場合は None。
-
-    API: XKT028
-    """
-    features = _fetch_features_in_radius("XKT028", api_key, lat, lng, radius_m)
-
+def _max_tsunami_depth(features: list[dict[str, Any]]) -> Optional[float]:
+    """津波フィーチャーの最大浸水深（メートル）。津波リスクなしは None"""
     if not features:
         return None
 
@@ -236,18 +402,8 @@ def fetch_tsunami_risk(
     return max_depth if max_depth > 0 else None
 
 
-def fetch_liquefaction_risk(
-    api_key: str, lat: float, lng: float, radius_m: float
-) -> str:
-    """
-    液状化リスクを取得し、最大リスクレベルを返す。
-
-    API: XKT025
-    Returns:
-        'low', 'moderate', or 'high'
-    """
-    features = _fetch_features_in_radius("XKT025", api_key, lat, lng, radius_m)
-
+def _max_liquefaction_risk(features: list[dict[str, Any]]) -> str:
+    """液状化フィーチャーの最大リスクレベル（'low' / 'moderate' / 'high'）"""
     if not features:
         return "low"
 
@@ -269,6 +425,177 @@ def fetch_liquefaction_risk(
     return max_risk
 
 
+def fetch_flood_risk(
+    api_key: str, lat: float, lng: float, radius_m: float
+) -> Optional[float]:
+    """
+    洪水浸水想定区域を取得し、最大浸水深（メートル）を返す。
+    浸水リスクなしの場合は None。
+
+    API: XKT026
+    """
+    features = _fetch_features_in_radius(HAZARD_ENDPOINTS["flood"], api_key, lat, lng, radius_m)
+    return _max_flood_depth(features)
+
+
+def fetch_landslide_risk(
+    api_key: str, lat: float, lng: float, radius_m: float
+) -> tuple[bool, bool]:
+    """
+    土砂災害警戒区域を取得。
+
+    API: XKT029
+    Returns:
+        (warning: bool, special_warning: bool)
+    """
+    features = _fetch_features_in_radius(
+        HAZARD_ENDPOINTS["landslide"], api_key, lat, lng, radius_m
+    )
+    return _landslide_zones(features)
+
+
+def fetch_tsunami_risk(
+    api_key: str, lat: float, lng: float, radius_m: float
+) -> Optional[float]:
+    """
+    津波浸水想定区域を取得し、最大浸水深（メートル）を返す。
+    津波リスクなしの場合は None。
+
+    API: XKT028
+    """
+    features = _fetch_features_in_radius(HAZARD_ENDPOINTS["tsunami"], api_key, lat, lng, radius_m)
+    return _max_tsunami_depth(features)
+
+
+def fetch_liquefaction_risk(
+    api_key: str, lat: float, lng: float, radius_m: float
+) -> str:
+    """
+    液状化リスクを取得し、最大リスクレベルを返す。
+
+    API: XKT025
+    Returns:
+        'low', 'moderate', or 'high'
+    """
+    features = _fetch_features_in_radius(
+        HAZARD_ENDPOINTS["liquefaction"], api_key, lat, lng, radius_m
+    )
+    return _max_liquefaction_risk(features)
+
+
+def fetch_tiles(
+    api_key: str,
+    tiles: list[tuple[str, int, int, int]],
+    concurrency: int = REINFOLIB_CONCURRENCY,
+) -> dict[tuple[str, int, int, int], list[tuple[Any, dict[str, Any]]]]:
+    """
+    複数タイルをスレッドプールで並行取得し、ジオメトリをパースして返す。
+
+    同時に最大 concurrency 件のリクエストを投げ、送信間隔は全スレッド共有の
+    トークンバケットで API のクォータ内に抑える。
+
+    Args:
+        tiles: [(endpoint, z, x, y), ...]
+        concurrency: 同時リクエスト数
+
+    Returns:
+        {(endpoint, z, x, y): [(shapely ジオメトリ, フィーチャー), ...]}
+    """
+    def load(tile: tuple[str, int, int, int]) -> list[tuple[Any, dict[str, Any]]]:
+        endpoint, z, x, y = tile
+        return _parse_features(_fetch_tile(endpoint, api_key, z, x, y))
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {executor.submit(load, tile): tile for tile in tiles}
+        for i, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if i % _PROGRESS_INTERVAL == 0:
+                logger.info("  タイル取得: %d/%d", i, len(tiles))
+    return results
+
+
+def fetch_hazard_for_geometries(
+    api_key: str,
+    geometries,
+    zoom: int = _DEFAULT_ZOOM,
+    concurrency: int = REINFOLIB_CONCURRENCY,
+) -> list[dict[str, Any]]:
+    """
+    複数の検索ジオメトリ（検索円・エリアのポリゴンなど）の4種の災害リスクをまとめて取得。
+
+    全ジオメトリのカバータイルの和集合をエンドポイントごとに1回ずつ取得し、
+    フィーチャーをエンドポイントごとの STRtree に索引して、
+    各ジオメトリとの交差判定をベクトル化された1回のクエリで行う。
+    API 呼び出し回数はジオメトリ数ではなくカバー面積に比例する。
+
+    Args:
+        geometries: shapely ジオメトリの配列（経度・緯度）
+        concurrency: 同時リクエスト数
+
+    Returns:
+        geometries と同じ順の fetch_station_hazard と同じ形式の dict リスト
+    """
+    union = plan_tiles(geometries, zoom)
+    logger.info(
+        "タイル計画: %d 件 → %d タイル × %d エンドポイント",
+        len(geometries), len(union), len(HAZARD_ENDPOINTS),
+    )
+
+    # タイルごとにジオメトリを1回だけパースし、全検索ジオメトリで共有する
+    fetched = fetch_tiles(
+        api_key,
+        [(endpoint, zoom, tx, ty) for endpoint in HAZARD_ENDPOINTS.values() for tx, ty in union],
+        concurrency,
+    )
+
+    matched: dict[str, list[list[dict[str, Any]]]] = {}
+    for name, endpoint in HAZARD_ENDPOINTS.items():
+        index = FeatureIndex(
+            [parsed for tx, ty in union for parsed in fetched[(endpoint, zoom, tx, ty)]]
+        )
+        logger.debug("%s (%s): %d フィーチャー", name, endpoint, len(index))
+        matched[name] = index.query(geometries)
+
+    results = []
+    for i in range(len(geometries)):
+        warning, special = _landslide_zones(matched["landslide"][i])
+        results.append({
+            "flood_depth": _max_flood_depth(matched["flood"][i]),
+            "landslide_warning": warning,
+            "landslide_special": special,
+            "tsunami_depth": _max_tsunami_depth(matched["tsunami"][i]),
+            "liquefaction_risk": _max_liquefaction_risk(matched["liquefaction"][i]),
+        })
+    return results
+
+
+def fetch_hazard_batch(
+    api_key: str,
+    points: list[tuple[float, float]],
+    radius_m: float,
+    zoom: int = _DEFAULT_ZOOM,
+    concurrency: int = REINFOLIB_CONCURRENCY,
+) -> list[dict[str, Any]]:
+    """
+    複数地点の4種の災害リスクをまとめて取得（各地点の半径 radius_m の円で判定）。
+
+    Args:
+        points: [(lat, lng), ...]
+        radius_m: 半径（メートル）
+        concurrency: 同時リクエスト数
+
+    Returns:
+        points と同じ順の fetch_station_hazard と同じ形式の dict リスト
+    """
+    if not points:
+        return []
+    lats, lngs = zip(*points)
+    return fetch_hazard_for_geometries(
+        api_key, search_areas(lats, lngs, radius_m), zoom, concurrency
+    )
+
+
 def fetch_station_hazard(
     api_key: str, lat: float, lng: float, radius_m: float
 ) -> dict[str, Any]:
@@ -284,15 +611,4 @@ def fetch_station_hazard(
             "liquefaction_risk": str,
         }
     """
-    flood = fetch_flood_risk(api_key, lat, lng, radius_m)
-    warning, special = fetch_landslide_risk(api_key, lat, lng, radius_m)
-    tsunami = fetch_tsunami_risk(api_key, lat, lng, radius_m)
-    liquefaction = fetch_liquefaction_risk(api_key, lat, lng, radius_m)
-
-    return {
-        "flood_depth": flood,
-        "landslide_warning": warning,
-        "landslide_special": special,
-        "tsunami_depth": tsunami,
-        "liquefaction_risk": liquefaction,
-    }
+    return fetch_hazard_batch(api_key, [(lat, lng)], radius_m)[0]
@@ -0,0 +1,269 @@
+"""
+空間インデックス
+緯度経度点群に対する半径検索（「地点 A から R メートル以内の点 B」）を
+numpy のベクトル演算でまとめて解くグリッドインデックス
+"""
+
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 地球の半径（メートル）。geo_utils.haversine_distance と同じ値を使う
+EARTH_RADIUS_M = 6_371_000
+
+# 等距円筒図法で投影した距離と Haversine 距離のずれを吸収する余裕（1%）。
+# 東京都の緯度幅（35.5〜35.9度）では投影誤差は 0.5% 未満。
+_PROJECTION_SLACK = 1.01
+
+
+# geohash の base32 文字（a, i, l, o を除く）
+_GEOHASH_BASE32 = np.array(list("0123456789bcdefghjkmnpqrstuvwxyz"))
+
+
+def geohash_np(lats, lngs, precision: int) -> np.ndarray:
+    """
+    緯度経度をまとめて geohash 文字列に変換する（precision 文字）。
+
+    経度・緯度を 2 進で量子化してビットを交互に並べる（経度が先）。
+    geohash は前方一致で空間的に近いセルをまとめられるので、並べ替えや
+    グルーピングのキーに使う。精度の目安: 5 文字 ≒ 4.9km × 4.9km。
+
+    Returns:
+        geohash 文字列の配列
+    """
+    lats = np.asarray(lats, dtype=float)
+    lngs = np.asarray(lngs, dtype=float)
+    n_bits = 5 * precision
+    lng_bits = (n_bits + 1) // 2
+    lat_bits = n_bits // 2
+
+    def quantize(v, lo, hi, bits):
+        q = np.floor((v - lo) / (hi - lo) * (1 << bits)).astype(np.int64)
+        return np.clip(q, 0, (1 << bits) - 1)
+
+    qx = quantize(lngs, -180.0, 180.0, lng_bits)
+    qy = quantize(lats, -90.0, 90.0, lat_bits)
+
+    code = np.zeros(len(lats), dtype=np.int64)
+    for i in range(n_bits):
+        # 偶数番目のビットは経度、奇数番目は緯度（いずれも上位ビットから）
+        if i % 2 == 0:
+            bit = (qx >> (lng_bits - 1 - i // 2)) & 1
+        else:
+            bit = (qy >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+
+    # 上位から 5 ビットずつ base32 の1文字にする
+    result = np.full(len(lats), "", dtype=f"<U{precision}")
+    for k in range(precision):
+        digit = (code >> (5 * (precision - 1 - k))) & 31
+        result = np.char.add(result, _GEOHASH_BASE32[digit])
+    return result
+
+
+def haversine_distance_np(
+    lat1: np.ndarray, lng1: np.ndarray, lat2: np.ndarray, lng2: np.ndarray
+) -> np.ndarray:
+    """
+    Haversine 距離の numpy 版（メートル単位、要素ごと）。
+
+    geo_utils.haversine_distance と同じ式なので、
+    スカラー版と同じ半径判定結果になる。
+    """
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dphi = np.radians(np.asarray(lat2) - np.asarray(lat1))
+    dlambda = np.radians(np.asarray(lng2) - np.asarray(lng1))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return EARTH_RADIUS_M * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+class GridIndex:
+    """
+    緯度経度点群のグリッドインデックス。
+
+    点群を基準緯度の等距円筒図法でメートル座標に投影し、
+    一辺 cell_m のセルに振り分けてセル ID でソートしておく。
+    半径検索はクエリ点の近傍セルを searchsorted で一括で引き、
+    候補ペアに対してのみ Haversine 距離を計算する。
+
+    構築 O(N log N)、クエリ 1 回あたり O(M log N + 候補ペア数)。
+
+    使用例:
+        index = GridIndex(town_lats, town_lngs, cell_m=1000)
+        query_idx, point_idx, dist = index.query_radius(st_lats, st_lngs, 1000)
+    """
+
+    def __init__(self, lats, lngs, cell_m: float):
+        """
+        Args:
+            lats: インデックス対象点の緯度リスト
+            lngs: インデックス対象点の経度リスト
+            cell_m: セルの一辺（メートル）。よく使う検索半径と同じ値にすると
+                クエリ時に参照するセルが 3×3 に収まる
+        """
+        self.lats = np.asarray(lats, dtype=float)
+        self.lngs = np.asarray(lngs, dtype=float)
+        if self.lats.shape != self.lngs.shape:
+            raise ValueError("lats と lngs の長さが一致しません")
+
+        self.cell_m = float(cell_m) * _PROJECTION_SLACK
+        self._ref_cos = (
+            math.cos(math.radians(float(self.lats.mean()))) if len(self.lats) else 1.0
+        )
+
+        self._x, self._y = self._project(self.lats, self.lngs)
+        keys = self._keys(*self._cells(self._x, self._y))
+        self._order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[self._order]
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    def _project(self, lats: np.ndarray, lngs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """緯度経度 → 等距円筒図法のメートル座標 (x, y)"""
+        x = np.radians(lngs) * EARTH_RADIUS_M * self._ref_cos
+        y = np.radians(lats) * EARTH_RADIUS_M
+        return x, y
+
+    def _cells(self, x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """メートル座標 → セル座標 (cx, cy)"""
+        return (
+            np.floor(x / self.cell_m).astype(np.int64),
+            np.floor(y / self.cell_m).astype(np.int64),
+        )
+
+    @staticmethod
+    def _keys(cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+        """セル座標を 1 つの int64 キーにまとめる（地球全周でも衝突しない幅）"""
+        return cx * (1 << 32) + cy
+
+    def query_radius(
+        self, lats, lngs, radius_m: float
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        各クエリ点から radius_m 以内にあるインデックス点をすべて返す。
+
+        Args:
+            lats: クエリ点の緯度リスト
+            lngs: クエリ点の経度リスト
+            radius_m: 検索半径（メートル、境界を含む）
+
+        Returns:
+            (query_idx, point_idx, distance_m) の 3 配列。
+            i 番目の要素が「クエリ query_idx[i] と点 point_idx[i] が
+            distance_m[i] メートル離れている」ことを表す。
+            query_idx 昇順、同一クエリ内は point_idx 昇順。
+        """
+        q_idx, p_idx, dist = self._pairs_within(lats, lngs, radius_m)
+        order = np.lexsort((p_idx, q_idx))
+        return q_idx[order], p_idx[order], dist[order]
+
+    def _pairs_within(
+        self, lats, lngs, radius_m: float
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """query_radius と同じペアを並べ替えずに返す"""
+        q_lats = np.asarray(lats, dtype=float)
+        q_lngs = np.asarray(lngs, dtype=float)
+        empty = (
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=float),
+        )
+        if len(q_lats) == 0 or len(self.lats) == 0:
+            return empty
+
+        reach = max(1, math.ceil(radius_m * _PROJECTION_SLACK / self.cell_m))
+        q_x, q_y = self._project(q_lats, q_lngs)
+        qx, qy = self._cells(q_x, q_y)
+
+        q_parts: list[np.ndarray] = []
+        p_parts: list[np.ndarray] = []
+        for dx in range(-reach, reach + 1):
+            for dy in range(-reach, reach + 1):
+                keys = self._keys(qx + dx, qy + dy)
+                lo = np.searchsorted(self._sorted_keys, keys, side="left")
+                hi = np.searchsorted(self._sorted_keys, keys, side="right")
+                counts = hi - lo
+                total = int(counts.sum())
+                if total == 0:
+                    continue
+                # 各クエリの [lo, hi) 区間を 1 本の位置配列に展開
+                q_idx = np.repeat(np.arange(len(q_lats)), counts)
+                starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+                pos = starts + np.arange(total)
+                q_parts.append(q_idx)
+                p_parts.append(self._order[pos])
+
+        if not q_parts:
+            return empty
+
+        q_idx = np.concatenate(q_parts)
+        p_idx = np.concatenate(p_parts)
+
+        # 投影座標の距離で候補を先に絞り、残ったペアだけ Haversine 距離を計算する
+        dx = q_x[q_idx] - self._x[p_idx]
+        dy = q_y[q_idx] - self._y[p_idx]
+        near = dx * dx + dy * dy <= (radius_m * _PROJECTION_SLACK) ** 2
+        q_idx, p_idx = q_idx[near], p_idx[near]
+
+        dist = haversine_distance_np(
+            q_lats[q_idx], q_lngs[q_idx], self.lats[p_idx], self.lngs[p_idx]
+        )
+        within = dist <= radius_m
+        return q_idx[within], p_idx[within], dist[within]
+
+    def query_nearest(
+        self, lats, lngs, max_distance_m: float, chunk_size: int = 20_000
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        各クエリ点から max_distance_m 以内で最も近いインデックス点を返す。
+
+        クエリ点を chunk_size 件ずつ query_radius に通すので、
+        作業メモリは「chunk_size × 近傍セル内の点数」で頭打ちになる。
+
+        Args:
+            lats: クエリ点の緯度リスト
+            lngs: クエリ点の経度リスト
+            max_distance_m: 探索距離の上限（メートル、境界を含む）
+            chunk_size: 1回に処理するクエリ点数
+
+        Returns:
+            (point_idx, distance_m) の 2 配列（クエリ点と同じ長さ）。
+            範囲内に点がなければ point_idx = -1、distance_m = inf。
+            距離が同じ点が複数あれば point_idx が小さい方を返す。
+        """
+        n = len(np.asarray(lats))
+        nearest = np.full(n, -1, dtype=np.int64)
+        distance = np.full(n, np.inf)
+        # 番兵: どの点番号よりも大きい値
+        best_point = np.full(n, len(self.lats), dtype=np.int64)
+
+        for q_idx, p_idx, dist in self.iter_pairs(lats, lngs, max_distance_m, chunk_size):
+            # ソートせずにクエリごとの最小距離を求め、最小距離のペアの中で点番号最小を選ぶ
+            np.minimum.at(distance, q_idx, dist)
+            is_best = dist == distance[q_idx]
+            np.minimum.at(best_point, q_idx[is_best], p_idx[is_best])
+
+        found = np.isfinite(distance)
+        nearest[found] = best_point[found]
+        return nearest, distance
+
+    def iter_pairs(self, lats, lngs, radius_m: float, chunk_size: int = 20_000):
+        """
+        query_radius と同じペアを、クエリ点 chunk_size 件ごとに並べ替えずに返すジェネレータ。
+        ペア全体をメモリに載せずに集計したいときに使う。
+
+        Yields:
+            (query_idx, point_idx, distance_m)。query_idx は全クエリ点での通し番号
+        """
+        q_lats = np.asarray(lats, dtype=float)
+        q_lngs = np.asarray(lngs, dtype=float)
+        for start in range(0, len(q_lats), chunk_size):
+            end = start + chunk_size
+            q_idx, p_idx, dist = self._pairs_within(q_lats[start:end], q_lngs[start:end], radius_m)
+            if len(q_idx):
+                yield q_idx + start, p_idx, dist
@@ -4,20 +4,125 @@ Supabase Python クライアント
 """
 
 import logging
-from typing import Any
+import queue
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, Optional
 
-from supabase import create_client, Client
+import httpx
+from supabase import ClientOptions, create_client, Client
 
-from config.settings import SUPABASE_URL, SUPABASE_KEY
+from config.settings import SUPABASE_URL, SUPABASE_KEY, SUPABASE_POOL_SIZE
 
 logger = logging.getLogger(__name__)
 
+# PostgREST リクエストのタイムアウト（秒）
+_REQUEST_TIMEOUT = 120
+
+# プロセス内で共有するクライアント（get_client() で遅延生成）
+_client: Optional[Client] = None
+_http_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+# 接続統計: requests=送信リクエスト数, opened=新規に確立した TCP 接続数
+_conn_stats = {"requests": 0, "opened": 0}
+_stats_lock = threading.Lock()
+
+
+def _trace_connection(event_name: str, info: dict[str, Any]) -> None:
+    """httpcore のトレースイベントから新規接続の確立を数える"""
+    if event_name == "connection.connect_tcp.complete":
+        with _stats_lock:
+            _conn_stats["opened"] += 1
+
+
+def _on_request(request: httpx.Request) -> None:
+    """送信前フック: リクエスト数を数え、接続トレースを仕込む"""
+    request.extensions["trace"] = _trace_connection
+    with _stats_lock:
+        _conn_stats["requests"] += 1
+
+
+def _build_http_client(pool_size: int) -> httpx.Client:
+    """HTTP/2 keep-alive の接続プール付き httpx クライアントを生成"""
+    return httpx.Client(
+        http2=True,
+        timeout=_REQUEST_TIMEOUT,
+        follow_redirects=True,
+        limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+        ),
+        event_hooks={"request": [_on_request]},
+    )
+
+
+def get_client(pool_size: Optional[int] = None) -> Client:
+    """
+    Supabase クライアントを取得（プロセス内で1つを共有）。
+
+    初回呼び出し時にクライアントと HTTP/2 keep-alive の接続プールを生成し、
+    以降は同じインスタンスを返す。バッチごとに upsert_records / select_all を
+    呼ぶスクリプトでも、TLS ハンドシェイクは接続プールの分だけで済む。
+
+    Args:
+        pool_size: 接続プールの最大接続数（初回生成時のみ有効、
+            省略時は SUPABASE_POOL_SIZE）
+    """
+    global _client, _http_client
+
+    if _client is not None:
+        return _client
 
-def get_client() -> Client:
-    """Supabase クライアントを取得"""
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise ValueError("SUPABASE_URL と SUPABASE_KEY を環境変数に設定してください")
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+    with _client_lock:
+        if _client is None:
+            size = pool_size or SUPABASE_POOL_SIZE
+            _http_client = _build_http_client(size)
+            _client = create_client(
+                SUPABASE_URL,
+                SUPABASE_KEY,
+                options=ClientOptions(httpx_client=_http_client),
+            )
+            logger.debug("Supabase クライアントを生成しました (pool_size=%d)", size)
+    return _client
+
+
+def close_client() -> None:
+    """共有クライアントの接続プールを閉じる（次回の get_client() で再生成）"""
+    global _client, _http_client
+
+    with _client_lock:
+        if _http_client is not None:
+            _http_client.close()
+        _client = None
+        _http_client = None
+
+
+def get_connection_stats() -> dict[str, int]:
+    """
+    接続統計を返す。
+
+    Returns:
+        {"requests": 送信リクエスト数, "opened": 新規接続数,
+         "reused": keep-alive 接続を再利用したリクエスト数}
+    """
+    with _stats_lock:
+        requests = _conn_stats["requests"]
+        opened = _conn_stats["opened"]
+    return {"requests": requests, "opened": opened, "reused": max(0, requests - opened)}
+
+
+def log_connection_stats() -> None:
+    """接続統計をログ出力"""
+    stats = get_connection_stats()
+    logger.info(
+        "Supabase 接続統計: リクエスト=%d, 新規接続=%d, 再利用=%d",
+        stats["requests"], stats["opened"], stats["reused"],
+    )
 
 
 def upsert_records(table: str, records: list[dict[str, Any]], on_conflict: str = "id") -> int:
@@ -43,38 +148,303 @@ def upsert_records(table: str, records: list[dict[str, Any]], on_conflict: str =
     return count
 
 
-def select_all(table: str, columns: str = "*") -> list[dict[str, Any]]:
+def _apply_filters(query, filters: Optional[dict[str, Any]]):
+    """
+    等価フィルタを PostgREST クエリに適用。
+
+    値が None のカラムは IS NULL、それ以外は = で絞り込む。
     """
-    テーブルの全レコードを取得（ページネーション対応）。
+    for column, value in (filters or {}).items():
+        if value is None:
+            query = query.is_(column, "null")
+        else:
+            query = query.eq(column, value)
+    return query
+
 
-    Supabase のデフォルト制限（1,000行）を超えるテーブルも全件取得する。
+def count_rows(table: str, filters: Optional[dict[str, Any]] = None) -> int:
+    """
+    テーブルの行数を取得（count=exact の HEAD リクエスト、行データは転送しない）。
 
     Args:
         table: テーブル名
-        columns: 取得するカラム（デフォルト: すべて）
+        filters: 等価フィルタ {カラム: 値}（None は IS NULL）
 
     Returns:
-        レコードのリスト
+        行数
     """
     client = get_client()
-    all_data: list[dict[str, Any]] = []
-    page_size = 1000
-    offset = 0
+    query = client.table(table).select("*", count="exact", head=True)
+    result = _apply_filters(query, filters).execute()
+    return result.count or 0
+
+
+def _iter_pages_keyset(
+    table: str,
+    select_cols: str,
+    filters: Optional[dict[str, Any]],
+    page_size: int,
+    key: str,
+    lower: Any = None,
+    upper: Any = None,
+) -> Iterator[list[dict[str, Any]]]:
+    """
+    key 昇順のキーセットページネーションでページを順に返す。
+
+    lower / upper を指定すると lower <= key < upper の範囲だけを読む（None は上下限なし）。
+    """
+    client = get_client()
+    last_key = None
 
     while True:
-        result = (
-            client.table(table)
-            .select(columns)
-            .range(offset, offset + page_size - 1)
-            .execute()
-        )
+        query = _apply_filters(client.table(table).select(select_cols), filters)
+        if last_key is not None:
+            query = query.gt(key, last_key)
+        elif lower is not None:
+            query = query.gte(key, lower)
+        if upper is not None:
+            query = query.lt(key, upper)
+        result = query.order(key).limit(page_size).execute()
+
         rows = result.data or []
-        all_data.extend(rows)
+        if rows:
+            last_key = rows[-1][key]
+            yield rows
         if len(rows) < page_size:
             break
-        offset += page_size
 
-    return all_data
+
+def _key_bounds(
+    table: str, filters: Optional[dict[str, Any]], key: str
+) -> Optional[tuple[Any, Any]]:
+    """key の最小値と最大値を返す（行がなければ None）"""
+    client = get_client()
+    ends = []
+    for desc in (False, True):
+        query = _apply_filters(client.table(table).select(key), filters)
+        rows = query.order(key, desc=desc).limit(1).execute().data or []
+        if not rows:
+            return None
+        ends.append(rows[0][key])
+    return ends[0], ends[1]
+
+
+def _split_key_range(lo: Any, hi: Any, parts: int) -> Optional[list[Any]]:
+    """
+    [lo, hi] を parts 個の範囲に分ける境界値（昇順、lo より大きい）を返す。
+
+    整数と UUID（16 バイトの大小 = PostgreSQL の uuid の順序）のみ分割できる。
+    それ以外の型は None。
+    """
+    if isinstance(lo, int) and isinstance(hi, int):
+        lo_n, hi_n, to_key = lo, hi, int
+    else:
+        try:
+            lo_n, hi_n = uuid.UUID(str(lo)).int, uuid.UUID(str(hi)).int
+        except ValueError:
+            return None
+        def to_key(n: int) -> str:
+            return str(uuid.UUID(int=n))
+
+    cuts = sorted({lo_n + (hi_n - lo_n) * i // parts for i in range(1, parts)} - {lo_n})
+    return [to_key(n) for n in cuts]
+
+
+def _iter_pages_concurrent(
+    table: str,
+    select_cols: str,
+    filters: Optional[dict[str, Any]],
+    page_size: int,
+    key: str,
+    concurrency: int,
+    buffer_pages: int = 2,
+) -> Iterator[list[dict[str, Any]]]:
+    """
+    key の空間を concurrency 個の範囲に分け、範囲ごとのキーセットカーソルを並列に進める。
+
+    範囲の境界は key の最小値・最大値から等分して決める（UUID の id はほぼ一様に分布する）。
+    各カーソルは前ページ最終行の key から続きを読むので、OFFSET のような読み飛ばしはなく、
+    途中で行が増減しても他のページとの重複・取りこぼしは起きない。
+
+    ページは範囲の順に返すので、全体として key 昇順になる（逐次取得と同じ順序）。
+    先頭の範囲は届いた順に返し、後ろの範囲は範囲ごとに buffer_pages ページまで先読みして
+    待たせる（0 なら上限なし。全件をリストにする select_all 用）。
+
+    事前に count=exact で行数を数え、page_size × concurrency 件以下なら
+    範囲分割の問い合わせのほうが高くつくので逐次のキーセットページネーションで読む。
+    key が整数・UUID 以外の場合も逐次で読む。
+    """
+    total = count_rows(table, filters)
+    if total == 0:
+        return
+    if total <= page_size * concurrency:
+        yield from _iter_pages_keyset(table, select_cols, filters, page_size, key)
+        return
+
+    bounds = _key_bounds(table, filters, key)
+    if bounds is None:
+        return
+    cuts = _split_key_range(*bounds, concurrency)
+    if not cuts:
+        logger.debug("%s: key=%s を範囲分割できないため逐次取得", table, key)
+        yield from _iter_pages_keyset(table, select_cols, filters, page_size, key)
+        return
+
+    edges = [None, *cuts, None]
+    ranges = list(zip(edges[:-1], edges[1:]))
+    logger.debug("%s: %d 行を key 空間の %d 範囲に分けて並列取得", table, total, len(ranges))
+
+    # 範囲ごとのキュー（読み手は範囲の順に取り出す）
+    range_pages: list[queue.Queue] = [queue.Queue(maxsize=buffer_pages) for _ in ranges]
+    stop = threading.Event()
+    done = object()
+
+    def put(pages: queue.Queue, item) -> bool:
+        """キューに入れる（読み手が止まったら諦めて False）"""
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read_range(pages: queue.Queue, lower, upper) -> None:
+        try:
+            for rows in _iter_pages_keyset(
+                table, select_cols, filters, page_size, key, lower, upper
+            ):
+                if not put(pages, rows):
+                    return
+        except Exception as e:
+            put(pages, e)
+            return
+        put(pages, done)
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        for pages, (lower, upper) in zip(range_pages, ranges):
+            executor.submit(read_range, pages, lower, upper)
+        try:
+            for pages in range_pages:
+                while True:
+                    item = pages.get()
+                    if item is done:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+        finally:
+            stop.set()
+
+
+def _iter_record_pages(
+    table: str,
+    columns: str,
+    filters: Optional[dict[str, Any]],
+    page_size: int,
+    key: str,
+    concurrency: int,
+    buffer_pages: int,
+) -> Iterator[list[dict[str, Any]]]:
+    """iter_rows / select_all 共通: key 昇順のページを返す（columns にない key は取り除く）"""
+    # ページ送りに key が必要なので、columns に無ければ追加して後で取り除く
+    select_cols = columns
+    strip_key = False
+    if columns != "*" and key not in [c.strip() for c in columns.split(",")]:
+        select_cols = f"{columns},{key}"
+        strip_key = True
+
+    if concurrency > 1:
+        pages = _iter_pages_concurrent(
+            table, select_cols, filters, page_size, key, concurrency, buffer_pages
+        )
+    else:
+        pages = _iter_pages_keyset(table, select_cols, filters, page_size, key)
+
+    for rows in pages:
+        if strip_key:
+            for row in rows:
+                del row[key]
+        yield rows
+
+
+def iter_rows(
+    table: str,
+    columns: str = "*",
+    filters: Optional[dict[str, Any]] = None,
+    page_size: int = 1000,
+    key: str = "id",
+    concurrency: int = 1,
+    batches: bool = False,
+) -> Iterator[Any]:
+    """
+    テーブルの全レコードを逐次取得するジェネレータ。
+
+    1ページ分ずつ取得して返すため、テーブル全体をメモリに載せずに
+    集計・グループ化できる。ページ送りは key 昇順のキーセット方式。
+
+    concurrency > 1 の場合は key の空間を concurrency 個の範囲に分け、
+    範囲ごとのキーセットカーソルを並列に進める。返す順序は concurrency=1 と同じ key 昇順で、
+    先読みは範囲ごとに 2 ページまで。
+
+    Args:
+        table: テーブル名
+        columns: 取得するカラム（デフォルト: すべて）
+        filters: 等価フィルタ {カラム: 値}（None は IS NULL）
+        page_size: 1ページの行数（Supabase の上限 1,000 以下）
+        key: ページ送りに使う一意カラム（デフォルト: id）
+        concurrency: 並列に進めるキーセットカーソルの数（1 なら逐次）
+        batches: True ならページ単位（レコードのリスト）で返す
+
+    Yields:
+        レコード（batches=True の場合はレコードのリスト）。key 昇順
+    """
+    for rows in _iter_record_pages(
+        table, columns, filters, page_size, key, concurrency, buffer_pages=2
+    ):
+        if batches:
+            yield rows
+        else:
+            yield from rows
+
+
+def select_all(
+    table: str,
+    columns: str = "*",
+    filters: Optional[dict[str, Any]] = None,
+    page_size: int = 1000,
+    key: str = "id",
+    concurrency: int = 1,
+) -> list[dict[str, Any]]:
+    """
+    テーブルの全レコードを取得（キーセットページネーション）。
+
+    key 昇順に並べ、前ページ最終行の key より大きい行を page_size 件ずつ取得する。
+    OFFSET 方式と違い前ページまでの行を読み飛ばさないため、
+    town_crimes のような大きいテーブルでも全件取得が行数に比例する。
+    全件をリストで保持する必要がなければ iter_rows() を使う。
+
+    concurrency > 1 の場合は範囲ごとのカーソルを先読みの上限なしで並列に進め、
+    範囲の順に連結する（結果は concurrency=1 と同じ key 昇順）。
+
+    Args:
+        table: テーブル名
+        columns: 取得するカラム（デフォルト: すべて）
+        filters: 等価フィルタ {カラム: 値}（None は IS NULL）
+        page_size: 1ページの行数（Supabase の上限 1,000 以下）
+        key: ページ送りに使う一意カラム（デフォルト: id）
+        concurrency: 並列に進めるキーセットカーソルの数（1 なら逐次）
+
+    Returns:
+        レコードのリスト（key 昇順）
+    """
+    return [
+        row
+        for rows in _iter_record_pages(
+            table, columns, filters, page_size, key, concurrency, buffer_pages=0
+        )
+        for row in rows
+    ]
 
 
 def insert_records(table: str, records: list[dict[str, Any]]) -> int:
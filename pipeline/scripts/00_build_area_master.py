@@ -20,7 +20,7 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from lib.area_master import load_areas_from_shapefile
 from lib.geo_utils import romanize_station_name
-from lib.supabase_client import upsert_records
+from lib.supabase_client import log_connection_stats, upsert_records
 
 logging.basicConfig(
     level=logging.INFO,
@@ -117,6 +117,7 @@ def main(args):
                     len(records),
                 )
         logger.info("areas: %d 件登録", total)
+        log_connection_stats()
 
     logger.info("=== 丁目マスタ投入完了 ===")
 
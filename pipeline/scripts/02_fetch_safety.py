@@ -23,10 +23,10 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from lib.crime_parser import (
     attach_boundaries,
     load_boundaries,
-    parse_crime_csv,
+    parse_crime_csv_columnar,
 )
 from lib.normalizer import normalize_score
-from lib.supabase_client import get_client, upsert_records, select_all
+from lib.supabase_client import get_client, iter_rows, upsert_records, select_all
 
 logging.basicConfig(
     level=logging.INFO,
@@ -83,34 +83,16 @@ def compute_station_scores(year: int, dry_run: bool) -> int:
     town_crimes を区市町村レベルで集計し、各駅の safety_scores を算出。
     犯罪率（千人あたり）ベースで偏差値を計算。
     """
-    client = get_client()
-
     # 駅一覧取得
     stations = select_all("stations", "id,name,municipality_code,municipality_name")
     logger.info("駅数: %d", len(stations))
 
     # town_crimes を区市町村別に集計（ページネーションで全行取得）
     cols = "municipality_code,total_crimes,crimes_violent,crimes_assault,crimes_theft,crimes_intellectual,crimes_other"
-    rows = []
-    page_size = 1000
-    offset = 0
-    while True:
-        page = (
-            client.table("town_crimes")
-            .select(cols)
-            .eq("year", year)
-            .range(offset, offset + page_size - 1)
-            .execute()
-        )
-        batch = page.data or []
-        rows.extend(batch)
-        if len(batch) < page_size:
-            break
-        offset += page_size
-    logger.info("town_crimes 取得行数: %d", len(rows))
-
     muni_agg: dict[str, dict] = {}
-    for r in rows:
+    row_count = 0
+    for r in iter_rows("town_crimes", cols, filters={"year": year}):
+        row_count += 1
         code = r["municipality_code"]
         if code not in muni_agg:
             muni_agg[code] = {
@@ -119,6 +101,7 @@ def compute_station_scores(year: int, dry_run: bool) -> int:
             }
         for key in muni_agg[code]:
             muni_agg[code][key] += r[key]
+    logger.info("town_crimes 取得行数: %d", row_count)
 
     logger.info("集計済み市区町村: %d", len(muni_agg))
 
@@ -139,23 +122,10 @@ def compute_station_scores(year: int, dry_run: bool) -> int:
 
     # 前年データ取得（previous_year_total 用）
     prev_year = year - 1
-    prev_rows = []
-    offset = 0
-    while True:
-        page = (
-            client.table("town_crimes")
-            .select("municipality_code,total_crimes")
-            .eq("year", prev_year)
-            .range(offset, offset + page_size - 1)
-            .execute()
-        )
-        batch = page.data or []
-        prev_rows.extend(batch)
-        if len(batch) < page_size:
-            break
-        offset += page_size
     prev_agg: dict[str, int] = {}
-    for r in prev_rows:
+    for r in iter_rows(
+        "town_crimes", "municipality_code,total_crimes", filters={"year": prev_year}
+    ):
         code = r["municipality_code"]
         prev_agg[code] = prev_agg.get(code, 0) + r["total_crimes"]
 
@@ -272,7 +242,7 @@ def main(args):
         logger.info("=== %d年 データ処理 ===", year)
 
         # 3a. CSVパース
-        records = parse_crime_csv(csv_path, year)
+        records = parse_crime_csv_columnar(csv_path, year)
         if args.limit:
             records = records[: args.limit]
 
@@ -5,10 +5,19 @@
 不動産情報ライブラリ API を使用して、
 各駅周辺の洪水・土砂・津波・液状化リスク情報を取得し、
 hazard_data テーブルに UPSERT する。
+タイルは全駅の和集合を1回ずつ取得し、駅ごとの判定はローカルで行う。
+
+--target areas では、同じタイルキャッシュを使って全丁目（areas）の
+境界ポリゴンと災害区域の交差を1回のベクトル化クエリで判定し、
+area_hazard_data テーブルに UPSERT する。
 
 データソース: 不動産情報ライブラリ API (https://www.reinfolib.mlit.go.jp/)
-出力テーブル: hazard_data
+出力テーブル: hazard_data / area_hazard_data
 更新頻度: 年次
+
+実行方法:
+  python scripts/03_fetch_hazard.py
+  python scripts/03_fetch_hazard.py --target areas
 """
 
 import argparse
@@ -16,12 +25,19 @@ import logging
 import sys
 from pathlib import Path
 
+import shapely
+
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from lib.reinfolib_client import fetch_station_hazard
+from lib.reinfolib_client import (
+    clear_tile_cache,
+    fetch_hazard_batch,
+    fetch_hazard_for_geometries,
+    log_tile_cache_stats,
+)
 from lib.normalizer import calculate_hazard_score
 from lib.supabase_client import get_client, upsert_records, select_all
-from config.settings import REINFOLIB_API_KEY, STATION_RADIUS_M
+from config.settings import REINFOLIB_API_KEY, REINFOLIB_CONCURRENCY, STATION_RADIUS_M
 
 logging.basicConfig(
     level=logging.INFO,
@@ -29,6 +45,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# area_hazard_data の UPSERT バッチサイズ
+AREA_UPSERT_BATCH = 500
+
+# areas（境界ポリゴン込みで大きい）を読むときの並列ページ数
+FETCH_CONCURRENCY = 4
+
 
 def classify_flood_level(depth: float | None) -> str:
     """洪水浸水深をレベルに分類"""
@@ -56,54 +78,39 @@ def classify_tsunami_level(depth: float | None) -> str:
     return "extreme"
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="不動産情報ライブラリAPIから駅ごとの災害リスクデータを取得・スコア化する"
-    )
-    parser.add_argument(
-        "--station-id",
-        type=str,
-        default=None,
-        help="特定の駅IDのみ処理（省略時は全駅）",
-    )
-    parser.add_argument(
-        "--radius",
-        type=float,
-        default=STATION_RADIUS_M,
-        help=f"検索半径（メートル、デフォルト: {STATION_RADIUS_M}m）",
-    )
-    parser.add_argument(
-        "--dry-run",
-        action="store_true",
-        help="DB書き込みを行わずに処理結果を表示",
-    )
-    parser.add_argument(
-        "--resume",
-        action="store_true",
-        help="hazard_data に既存の駅をスキップして途中再開",
-    )
-    parser.add_argument(
-        "--limit",
-        type=int,
-        default=0,
-        help="処理件数制限（デバッグ用）",
-    )
-    parser.add_argument(
-        "--verbose", "-v",
-        action="store_true",
-        help="詳細ログを出力",
+def build_hazard_record(hazard: dict) -> dict:
+    """
+    災害リスク判定結果からスコアを算出し、hazard_data / area_hazard_data 共通の
+    カラムを持つレコードを作る（station_id / area_name は呼び出し側で付与）。
+    """
+    total, flood_score, landslide_score, tsunami_score, liquefaction_score = (
+        calculate_hazard_score(
+            flood_depth=hazard["flood_depth"],
+            landslide_warning=hazard["landslide_warning"],
+            landslide_special=hazard["landslide_special"],
+            tsunami_depth=hazard["tsunami_depth"],
+            liquefaction_risk=hazard["liquefaction_risk"],
+        )
     )
-    args = parser.parse_args()
 
-    if args.verbose:
-        logging.getLogger().setLevel(logging.DEBUG)
+    return {
+        "flood_depth_max": hazard["flood_depth"],
+        "flood_level": classify_flood_level(hazard["flood_depth"]),
+        "flood_score": flood_score,
+        "landslide_warning": hazard["landslide_warning"],
+        "landslide_special": hazard["landslide_special"],
+        "landslide_score": landslide_score,
+        "tsunami_depth_max": hazard["tsunami_depth"],
+        "tsunami_level": classify_tsunami_level(hazard["tsunami_depth"]),
+        "tsunami_score": tsunami_score,
+        "liquefaction_risk": hazard["liquefaction_risk"],
+        "liquefaction_score": liquefaction_score,
+        "score": total,
+    }
 
-    if not REINFOLIB_API_KEY:
-        logger.error("REINFOLIB_API_KEY が設定されていません。.env を確認してください。")
-        sys.exit(1)
-
-    logger.info("=== 災害リスクデータ取得開始 ===")
 
+def process_stations(args) -> None:
+    """駅ごとの災害リスクを取得して hazard_data に UPSERT"""
     # 1. stations テーブルから全駅を取得
     logger.info("Step 1: 駅データ取得中...")
     if args.station_id:
@@ -148,48 +155,28 @@ def main():
 
     logger.info("対象駅数: %d", len(valid_stations))
 
-    # 2. 各駅の災害リスク取得 + スコア算出
-    logger.info("Step 2: API 呼び出し + スコア算出中...")
+    # 2. 全駅のカバータイルをまとめて取得し、駅ごとの災害リスクを判定
+    # （中断してもタイルキャッシュに取得済み分が残る）
+    logger.info("Step 2: タイル取得 + 駅ごとの判定中...")
+    hazards = fetch_hazard_batch(
+        REINFOLIB_API_KEY,
+        [(s["lat"], s["lng"]) for s in valid_stations],
+        args.radius,
+        concurrency=args.concurrency,
+    )
+
+    # 3. スコア算出 + UPSERT
+    logger.info("Step 3: スコア算出 + UPSERT 中...")
     records = []
     batch_size = 50
 
-    for i, station in enumerate(valid_stations):
-        logger.info(
-            "  [%d/%d] %s (%.4f, %.4f)...",
-            i + 1, len(valid_stations),
-            station["name"], station["lat"], station["lng"],
+    for station, hazard in zip(valid_stations, hazards):
+        logger.debug(
+            "  %s (%.4f, %.4f): %s",
+            station["name"], station["lat"], station["lng"], hazard,
         )
 
-        hazard = fetch_station_hazard(
-            REINFOLIB_API_KEY, station["lat"], station["lng"], args.radius
-        )
-
-        # スコア算出
-        total, flood_score, landslide_score, tsunami_score, liquefaction_score = (
-            calculate_hazard_score(
-                flood_depth=hazard["flood_depth"],
-                landslide_warning=hazard["landslide_warning"],
-                landslide_special=hazard["landslide_special"],
-                tsunami_depth=hazard["tsunami_depth"],
-                liquefaction_risk=hazard["liquefaction_risk"],
-            )
-        )
-
-        record = {
-            "station_id": station["id"],
-            "flood_depth": hazard["flood_depth"],
-            "flood_level": classify_flood_level(hazard["flood_depth"]),
-            "flood_score": flood_score,
-            "landslide_warning": hazard["landslide_warning"],
-            "landslide_special": hazard["landslide_special"],
-            "landslide_score": landslide_score,
-            "tsunami_depth": hazard["tsunami_depth"],
-            "tsunami_level": classify_tsunami_level(hazard["tsunami_depth"]),
-            "tsunami_score": tsunami_score,
-            "liquefaction_risk": hazard["liquefaction_risk"],
-            "liquefaction_score": liquefaction_score,
-            "score": total,
-        }
+        record = {"station_id": station["id"], **build_hazard_record(hazard)}
         records.append(record)
 
         # バッチ UPSERT（中断しても処理済み分は残る）
@@ -214,6 +201,160 @@ def main():
         else:
             upsert_records("hazard_data", records, on_conflict="station_id")
 
+
+def process_areas(args) -> None:
+    """全丁目の境界ポリゴンで災害リスクを判定して area_hazard_data に UPSERT"""
+    # 1. areas テーブルから境界ポリゴン（WKT）を取得
+    logger.info("Step 1: 丁目データ取得中...")
+    areas = select_all("areas", "area_name,boundary", concurrency=FETCH_CONCURRENCY)
+    valid_areas = [a for a in areas if a.get("boundary")]
+    if len(valid_areas) < len(areas):
+        logger.warning("境界ポリゴンなし: %d エリアをスキップ", len(areas) - len(valid_areas))
+
+    if args.resume:
+        existing = {r["area_name"] for r in select_all("area_hazard_data", "area_name")}
+        before = len(valid_areas)
+        valid_areas = [a for a in valid_areas if a["area_name"] not in existing]
+        logger.info(
+            "レジューム: %d エリア済み → 残り %d エリア",
+            before - len(valid_areas), len(valid_areas),
+        )
+
+    if args.limit:
+        valid_areas = valid_areas[: args.limit]
+
+    # 全ポリゴンを一括でパース。WKT が壊れているエリアは None になるので除外し、
+    # 自己交差などの無効なポリゴンは交差判定で GEOS の例外にならないよう修復する
+    polygons = shapely.from_wkt([a["boundary"] for a in valid_areas], on_invalid="warn")
+    parsed = ~shapely.is_missing(polygons)
+    if not parsed.all():
+        logger.warning("境界ポリゴンの WKT が不正: %d エリアをスキップ", int((~parsed).sum()))
+        valid_areas = [a for a, ok in zip(valid_areas, parsed.tolist()) if ok]
+        polygons = polygons[parsed]
+    invalid = ~shapely.is_valid(polygons)
+    if invalid.any():
+        logger.info("無効な境界ポリゴンを修復: %d エリア", int(invalid.sum()))
+        polygons[invalid] = shapely.make_valid(polygons[invalid])
+
+    if not valid_areas:
+        logger.info("処理対象のエリアがありません")
+        return
+
+    logger.info("対象エリア数: %d", len(valid_areas))
+
+    # 2. タイル取得 + 交差判定
+    logger.info("Step 2: タイル取得 + エリアごとの判定中...")
+    hazards = fetch_hazard_for_geometries(
+        REINFOLIB_API_KEY, polygons, concurrency=args.concurrency
+    )
+
+    # 3. スコア算出 + 一括 UPSERT
+    logger.info("Step 3: スコア算出 + UPSERT 中...")
+    records = [
+        {"area_name": area["area_name"], **build_hazard_record(hazard)}
+        for area, hazard in zip(valid_areas, hazards)
+    ]
+
+    if args.dry_run:
+        logger.info("[DRY RUN] %d 件（DB書き込みスキップ）", len(records))
+        for r in sorted(records, key=lambda r: r["score"])[:10]:
+            logger.info(
+                "    %s | score=%.1f | 洪水=%s 土砂W=%s 津波=%s 液状=%s",
+                r["area_name"], r["score"],
+                r["flood_level"], r["landslide_warning"],
+                r["tsunami_level"], r["liquefaction_risk"],
+            )
+        return
+
+    for i in range(0, len(records), AREA_UPSERT_BATCH):
+        upsert_records(
+            "area_hazard_data", records[i : i + AREA_UPSERT_BATCH], on_conflict="area_name"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="不動産情報ライブラリAPIから駅ごとの災害リスクデータを取得・スコア化する"
+    )
+    parser.add_argument(
+        "--target",
+        type=str,
+        choices=["stations", "areas"],
+        default="stations",
+        help="判定対象（stations: 駅の半径円 → hazard_data、areas: 丁目ポリゴン → area_hazard_data）",
+    )
+    parser.add_argument(
+        "--station-id",
+        type=str,
+        default=None,
+        help="特定の駅IDのみ処理（省略時は全駅、--target stations のみ）",
+    )
+    parser.add_argument(
+        "--radius",
+        type=float,
+        default=None,
+        help=f"検索半径（メートル、デフォルト: {STATION_RADIUS_M}m、--target stations のみ）",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="DB書き込みを行わずに処理結果を表示",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help=(
+            "既存データをスキップして途中再開"
+            "（stations: hazard_data の駅、areas: area_hazard_data の丁目）"
+        ),
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=0,
+        help="処理件数制限（デバッグ用）",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=REINFOLIB_CONCURRENCY,
+        help=f"API の同時リクエスト数（デフォルト: {REINFOLIB_CONCURRENCY}）",
+    )
+    parser.add_argument(
+        "--refresh-tiles",
+        action="store_true",
+        help="タイルキャッシュを削除してから全タイルを再取得",
+    )
+    parser.add_argument(
+        "--verbose", "-v",
+        action="store_true",
+        help="詳細ログを出力",
+    )
+    args = parser.parse_args()
+
+    if args.target == "areas" and (args.station_id or args.radius is not None):
+        parser.error("--station-id / --radius は --target stations でのみ指定できます")
+    if args.radius is None:
+        args.radius = STATION_RADIUS_M
+
+    if args.verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    if args.refresh_tiles:
+        logger.info("タイルキャッシュ削除: %d 件", clear_tile_cache())
+
+    if not REINFOLIB_API_KEY:
+        logger.error("REINFOLIB_API_KEY が設定されていません。.env を確認してください。")
+        sys.exit(1)
+
+    logger.info("=== 災害リスクデータ取得開始 (対象: %s) ===", args.target)
+
+    if args.target == "areas":
+        process_areas(args)
+    else:
+        process_stations(args)
+
+    log_tile_cache_stats()
     logger.info("=== 災害リスクデータ取得完了 ===")
 
 
@@ -6,6 +6,20 @@ e-Stat API（国勢調査 小地域集計）と Overpass API（OpenStreetMap）
 各丁目の人口構成・施設数を取得し、タグを自動生成して
 area_vibe_data テーブルに UPSERT する。
 
+施設数は既定でバッチモード（数地点ずつの around クエリをエンドポイントごとのワーカーで
+並列に取得し、バッチごとに DB に保存）で取得する。中断しても保存済みの丁目は残り、
+--resume で続きから再開できる。バッチサイズは geohash セルごとに前回までの応答時間・要素数・
+タイムアウトから調整する（data/cache/overpass_stats.json）。
+--osm-mode bulk では東京全域の bbox を地点密度に応じたシャードに分割して並列取得し、
+ローカルで各丁目に割り当てる。全丁目の集計が終わってからまとめて保存するため、
+途中で中断すると DB には何も書き込まれない（取得済みシャードはキャッシュから再利用される）。
+--osm-pbf を指定すると Overpass API の代わりにローカルの .osm.pbf 抽出から集計する（要 pyosmium）。
+Overpass の取得結果は data/cache/overpass にキャッシュし、再実行時（半径変更・中断後を含む）に
+再利用する（--refresh-osm で削除して取り直す）。
+e-Stat の取得結果は data/cache/estat にキャッシュする（--refresh-estat で削除して取り直す）。
+--count-mode radius を指定すると、各丁目から半径内の施設をすべて数える
+（既定の nearest は各施設を最寄りの丁目1つにだけ数える）。
+
 データソース: e-Stat API + Overpass API
 入力テーブル: areas（丁目マスタ）
 出力テーブル: area_vibe_data
@@ -19,10 +33,16 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from lib.estat_client import fetch_all_estat_area_data
+from lib.estat_client import clear_estat_cache, fetch_all_estat_area_data
 from lib.normalizer import generate_vibe_tags
-from lib.overpass_client import fetch_all_stations_facilities
-from lib.supabase_client import get_client, select_all, upsert_records
+from lib.overpass_client import (
+    COUNT_MODES,
+    clear_facility_cache,
+    fetch_bulk_facilities,
+    fetch_facilities_in_batches,
+    fetch_local_facilities,
+)
+from lib.supabase_client import get_client, log_connection_stats, select_all, upsert_records
 from config.settings import ESTAT_API_KEY, STATION_RADIUS_M
 
 logging.basicConfig(
@@ -204,7 +224,8 @@ def main(args):
         }
 
     # 4. Overpass API + レコード構築 + 逐次書き込み
-    #    バッチごとに DB に保存するため、中断しても処理済み分は残る
+    #    バッチモードはバッチごとに DB に保存するため、中断しても処理済み分は残る
+    #    （一括モード・ローカル抽出モードは全件集計後にまとめて保存）
     if args.skip_osm:
         logger.info("Step 3: Overpass API スキップ (--skip-osm)")
         zero = {
@@ -220,57 +241,47 @@ def main(args):
             _print_dry_run(records)
         else:
             _upsert_all(records)
-    else:
-        logger.info("Step 3: Overpass API + 逐次書き込み...")
-        from lib.overpass_client import (
-            _BATCH_SIZE, _BATCH_DELAY, _ENDPOINTS,
-            fetch_batch_facilities,
-        )
-        import math
-        import time
-
-        total = len(valid_areas)
-        num_batches = math.ceil(total / _BATCH_SIZE)
-        total_saved = 0
-
-        logger.info(
-            "バッチ取得モード: %d 地点 → %d バッチ (各%d地点, %ds間隔, 逐次DB保存)",
-            total, num_batches, _BATCH_SIZE, _BATCH_DELAY,
-        )
-
-        for batch_idx in range(num_batches):
-            start = batch_idx * _BATCH_SIZE
-            end = min(start + _BATCH_SIZE, total)
-            batch_areas = valid_areas[start:end]
+    elif args.osm_mode == "bulk" or args.osm_pbf:
+        if args.osm_pbf:
+            logger.info("Step 3: ローカル OSM 抽出から施設数を集計 (%s)...", args.osm_pbf)
+            all_facilities = fetch_local_facilities(
+                valid_areas, args.osm_pbf, args.radius, args.count_mode
+            )
+        else:
+            logger.info("Step 3: Overpass API（一括モード）...")
+            all_facilities = fetch_bulk_facilities(valid_areas, args.radius, args.count_mode)
 
-            if batch_idx > 0:
-                time.sleep(_BATCH_DELAY)
+        records = [_build_record(a, f) for a, f in zip(valid_areas, all_facilities)]
+        logger.info("レコード生成完了: %d 件", len(records))
 
-            ep_idx = batch_idx % len(_ENDPOINTS)
-            batch_facilities = fetch_batch_facilities(batch_areas, args.radius, ep_idx)
+        if args.dry_run:
+            _print_dry_run(records)
+        else:
+            _upsert_all(records)
+    else:
+        logger.info("Step 3: Overpass API（バッチモード）+ 逐次書き込み...")
+        total_saved = 0
 
-            # レコード構築
+        def _save_batch(batch_areas, batch_facilities):
+            nonlocal total_saved
             batch_records = [
                 _build_record(a, f) for a, f in zip(batch_areas, batch_facilities)
             ]
-
             # 逐次 DB 書き込み（dry-run でなければ）
             if not args.dry_run:
                 upsert_records("area_vibe_data", batch_records, on_conflict="area_name")
-
             total_saved += len(batch_records)
 
-            if (batch_idx + 1) % 10 == 0 or end == total:
-                logger.info(
-                    "進捗: %d / %d 地点 (バッチ %d/%d, DB保存済み: %d)",
-                    end, total, batch_idx + 1, num_batches, total_saved,
-                )
+        fetch_facilities_in_batches(
+            valid_areas, args.radius, args.count_mode, on_batch=_save_batch
+        )
 
         if args.dry_run:
             logger.info("[DRY RUN] 全 %d 件（DB書き込みなし）", total_saved)
 
         logger.info("area_vibe_data: %d 件処理完了", total_saved)
 
+    log_connection_stats()
     logger.info("=== 雰囲気データ取得完了 ===")
 
 
@@ -298,6 +309,39 @@ if __name__ == "__main__":
         action="store_true",
         help="Overpass API の呼び出しをスキップ",
     )
+    parser.add_argument(
+        "--osm-mode",
+        type=str,
+        choices=["bulk", "batch"],
+        default="batch",
+        help=(
+            "施設数の取得方式（batch: 数地点ずつ around クエリ、バッチごとに保存。"
+            "bulk: シャード分割 bbox 一括取得、全件集計後にまとめて保存するため中断時は保存されない）"
+        ),
+    )
+    parser.add_argument(
+        "--refresh-estat",
+        action="store_true",
+        help="e-Stat の取得結果キャッシュを削除してから再取得",
+    )
+    parser.add_argument(
+        "--osm-pbf",
+        type=str,
+        default=None,
+        help="ローカルの .osm.pbf 抽出から施設数を集計（Overpass API を使わない、要 pyosmium）",
+    )
+    parser.add_argument(
+        "--refresh-osm",
+        action="store_true",
+        help="Overpass の施設キャッシュを削除してから全シャード・バッチを再取得",
+    )
+    parser.add_argument(
+        "--count-mode",
+        type=str,
+        choices=list(COUNT_MODES),
+        default="nearest",
+        help="施設の集計方式（nearest: 最寄りの丁目1つに計上、radius: 半径内の全丁目に計上）",
+    )
     parser.add_argument(
         "--dry-run",
         action="store_true",
@@ -324,4 +368,9 @@ if __name__ == "__main__":
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
 
+    if args.refresh_estat:
+        logger.info("e-Stat キャッシュ削除: %d 件", clear_estat_cache())
+    if args.refresh_osm:
+        logger.info("Overpass 施設キャッシュ削除: %d 件", clear_facility_cache())
+
     main(args)
@@ -9,7 +9,7 @@ safety_scores および hazard_data のスコア・ランキングを再計算
 safety_scores: 各駅の周辺（半径1km）のエリアを空間集約し、
 犯罪率（千人あたり）ベースで偏差値を算出する。
 
-hazard_data: 03_fetch_hazard.py で算出済みの score に基づき
+hazard_data / area_hazard_data: 03_fetch_hazard.py で算出済みの score に基づき
 ランキングのみ再計算する。
 
 実行方法:
@@ -24,35 +24,18 @@ import sys
 from collections import defaultdict
 from pathlib import Path
 
+import numpy as np
+
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from lib.geo_utils import haversine_distance
-from lib.supabase_client import get_client, upsert_records
+from lib.spatial_index import GridIndex
+from lib.supabase_client import iter_rows, select_all, upsert_records
 from lib.normalizer import normalize_score
 
 logger = logging.getLogger(__name__)
 
-PAGE_SIZE = 1000
-
-
-def fetch_all_rows(table: str, columns: str) -> list[dict]:
-    """ページネーションで全行を取得（Supabase のデフォルト1000件制限を回避）"""
-    client = get_client()
-    rows: list[dict] = []
-    offset = 0
-    while True:
-        page = (
-            client.table(table)
-            .select(columns)
-            .range(offset, offset + PAGE_SIZE - 1)
-            .execute()
-        )
-        batch = page.data or []
-        rows.extend(batch)
-        if len(batch) < PAGE_SIZE:
-            break
-        offset += PAGE_SIZE
-    return rows
+# 大きいテーブル（safety_scores / town_crimes）を読むときの並列ページ数
+FETCH_CONCURRENCY = 4
 
 
 def recalculate_safety_scores(dry_run: bool) -> int:
@@ -63,23 +46,21 @@ def recalculate_safety_scores(dry_run: bool) -> int:
     犯罪率（千人あたり）ベースで偏差値を算出する。
     """
     # 既存の safety_scores レコードを取得（ID保持のため）
-    records = fetch_all_rows("safety_scores", "id,station_id,year,total_crimes")
+    records = select_all(
+        "safety_scores", "id,station_id,year,total_crimes", concurrency=FETCH_CONCURRENCY
+    )
     if not records:
         logger.warning("safety_scores レコードなし - スキップ")
         return 0
     logger.info("safety_scores 取得件数: %d", len(records))
 
     # 駅データ取得（lat/lng 必須）
-    stations = fetch_all_rows("stations", "id,name,lat,lng")
+    stations = select_all("stations", "id,name,lat,lng")
     station_map = {s["id"]: s for s in stations if s.get("lat") and s.get("lng")}
     logger.info("座標あり駅数: %d / %d", len(station_map), len(stations))
 
-    # town_crimes データ取得（lat/lng 付き）
-    town_data = fetch_all_rows("town_crimes", "area_name,year,total_crimes,lat,lng")
-    logger.info("town_crimes 取得件数: %d", len(town_data))
-
     # 人口データ取得
-    pop_data = fetch_all_rows("area_vibe_data", "area_name,total_population")
+    pop_data = select_all("area_vibe_data", "area_name,total_population")
     pop_map = {r["area_name"]: r.get("total_population") for r in pop_data}
     logger.info("人口データ取得: %d エリア", len(pop_map))
 
@@ -88,11 +69,16 @@ def recalculate_safety_scores(dry_run: bool) -> int:
     for r in records:
         by_year[r["year"]].append(r)
 
-    # town_crimes を年ごとにグループ化（座標あり のみ）
+    # town_crimes を逐次取得しながら年ごとにグループ化（座標あり のみ）
     town_by_year: dict[int, list[dict]] = defaultdict(list)
-    for t in town_data:
+    town_count = 0
+    for t in iter_rows(
+        "town_crimes", "area_name,year,total_crimes,lat,lng", concurrency=FETCH_CONCURRENCY
+    ):
+        town_count += 1
         if t.get("lat") and t.get("lng"):
             town_by_year[t["year"]].append(t)
+    logger.info("town_crimes 取得件数: %d", town_count)
 
     RADIUS_M = 1000
 
@@ -103,30 +89,37 @@ def recalculate_safety_scores(dry_run: bool) -> int:
         logger.info("  %d年: %d 駅, %d エリア（座標あり）", year, len(year_records), len(year_towns))
 
         # 各駅の犯罪率を計算
-        station_rates: list[tuple[dict, float | None]] = []
-        for rec in year_records:
-            station = station_map.get(rec["station_id"])
-            if not station:
-                station_rates.append((rec, None))
-                continue
-
-            # 半径内のエリアを検索
-            slat, slng = station["lat"], station["lng"]
-            nearby_crimes = 0
-            nearby_pop = 0
-            for t in year_towns:
-                dist = haversine_distance(slat, slng, t["lat"], t["lng"])
-                if dist <= RADIUS_M:
-                    nearby_crimes += t["total_crimes"]
-                    pop = pop_map.get(t["area_name"])
-                    if pop and pop > 0:
-                        nearby_pop += pop
-
-            if nearby_pop > 0:
-                crime_rate = nearby_crimes / nearby_pop * 1000
-            else:
-                crime_rate = None
-            station_rates.append((rec, crime_rate))
+        # 年ごとにエリア重心のグリッドインデックスを構築し、全駅の半径検索を一括で行う
+        located = [
+            i for i, rec in enumerate(year_records)
+            if rec["station_id"] in station_map
+        ]
+        index = GridIndex(
+            [t["lat"] for t in year_towns], [t["lng"] for t in year_towns], cell_m=RADIUS_M
+        )
+        st_idx, town_idx, _ = index.query_radius(
+            [station_map[year_records[i]["station_id"]]["lat"] for i in located],
+            [station_map[year_records[i]["station_id"]]["lng"] for i in located],
+            RADIUS_M,
+        )
+
+        town_crimes = np.array([t["total_crimes"] for t in year_towns], dtype=float)
+        town_pop = np.array(
+            [max(pop_map.get(t["area_name"]) or 0, 0) for t in year_towns], dtype=float
+        )
+        nearby_crimes = np.bincount(
+            st_idx, weights=town_crimes[town_idx], minlength=len(located)
+        )
+        nearby_pop = np.bincount(
+            st_idx, weights=town_pop[town_idx], minlength=len(located)
+        )
+
+        crime_rates: list[float | None] = [None] * len(year_records)
+        for k, i in enumerate(located):
+            if nearby_pop[k] > 0:
+                crime_rates[i] = float(nearby_crimes[k] / nearby_pop[k] * 1000)
+
+        station_rates: list[tuple[dict, float | None]] = list(zip(year_records, crime_rates))
 
         # 犯罪率ベースで偏差値計算
         scored = [(rec, cr) for rec, cr in station_rates if cr is not None]
@@ -198,7 +191,7 @@ def recalculate_hazard_scores(dry_run: bool) -> int:
     score（0-100、高いほど安全）は 03_fetch_hazard.py で算出済み。
     ここでは score 降順でランクを付与する。
     """
-    records = fetch_all_rows(
+    records = select_all(
         "hazard_data",
         "id,station_id,score,flood_score,landslide_score,tsunami_score,liquefaction_score",
     )
@@ -244,6 +237,40 @@ def recalculate_hazard_scores(dry_run: bool) -> int:
     return count
 
 
+def recalculate_area_hazard_scores(dry_run: bool) -> int:
+    """
+    area_hazard_data テーブルのランキングを再計算。
+
+    score は 03_fetch_hazard.py --target areas で算出済み。
+    ここでは score 降順でランクを付与する。
+    """
+    records = select_all("area_hazard_data", "area_name,score")
+    if not records:
+        logger.info("area_hazard_data レコードなし - スキップ")
+        return 0
+
+    logger.info("area_hazard_data 取得件数: %d", len(records))
+
+    sorted_records = sorted(records, key=lambda r: -(r.get("score") or 0))
+    updates = [
+        {"area_name": r["area_name"], "rank": rank}
+        for rank, r in enumerate(sorted_records, start=1)
+    ]
+
+    if dry_run:
+        logger.info("[DRY RUN] area_hazard_data: %d 件のランキング更新をスキップ", len(updates))
+        logger.info("  === 安全なエリア TOP 10 ===")
+        for r in sorted_records[:10]:
+            logger.info("    %s | score=%.1f", r["area_name"], r.get("score") or 0)
+        return len(updates)
+
+    count = 0
+    for i in range(0, len(updates), 500):
+        count += upsert_records("area_hazard_data", updates[i : i + 500], on_conflict="area_name")
+    logger.info("area_hazard_data: %d 件のランキングを更新", count)
+    return count
+
+
 def main():
     """メイン処理"""
     parser = argparse.ArgumentParser(
@@ -252,7 +279,7 @@ def main():
     parser.add_argument(
         "--table",
         type=str,
-        choices=["safety_scores", "hazard_data", "all"],
+        choices=["safety_scores", "hazard_data", "area_hazard_data", "all"],
         default="all",
         help="再計算対象テーブル（デフォルト: all）",
     )
@@ -285,6 +312,10 @@ def main():
         logger.info("--- 災害スコア再計算 ---")
         total_updated += recalculate_hazard_scores(args.dry_run)
 
+    if args.table in ("area_hazard_data", "all"):
+        logger.info("--- エリア災害スコア再計算 ---")
+        total_updated += recalculate_area_hazard_scores(args.dry_run)
+
     logger.info("=== スコア再計算完了 (合計: %d 件) ===", total_updated)
 
 
@@ -19,7 +19,7 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from lib.geo_utils import romanize_station_name
 from lib.normalizer import normalize_score
-from lib.supabase_client import get_client, select_all
+from lib.supabase_client import get_client, iter_rows, select_all
 
 logging.basicConfig(
     level=logging.INFO,
@@ -27,28 +27,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-PAGE_SIZE = 1000
+
+# UPSERT 用の全 NOT NULL カラム
+UPSERT_COLS = "id,area_name,municipality_code,municipality_name,year,total_crimes,crimes_violent,crimes_assault,crimes_theft,crimes_intellectual,crimes_other"
 
 
 def fetch_all_town_crimes() -> list[dict]:
-    """town_crimes の全行をページネーションで取得（UPSERT用に全NOT NULLカラムを含む）"""
-    client = get_client()
-    cols = "id,area_name,municipality_code,municipality_name,year,total_crimes,crimes_violent,crimes_assault,crimes_theft,crimes_intellectual,crimes_other"
-    rows: list[dict] = []
-    offset = 0
-    while True:
-        page = (
-            client.table("town_crimes")
-            .select(cols)
-            .range(offset, offset + PAGE_SIZE - 1)
-            .execute()
-        )
-        batch = page.data or []
-        rows.extend(batch)
-        if len(batch) < PAGE_SIZE:
-            break
-        offset += PAGE_SIZE
-    return rows
+    """town_crimes の全行からスラッグ生成・偏差値計算に必要なカラムだけを取得"""
+    return select_all("town_crimes", "id,area_name,year,total_crimes")
 
 
 def generate_area_slugs(rows: list[dict]) -> dict[str, str]:
@@ -178,19 +164,18 @@ def main(args):
     logger.info("偏差値計算完了: %d 行", len(score_map))
 
     # 5. 更新レコード作成（全NOT NULLカラムを含めてUPSERT）
-    updates = []
-    for r in rows:
-        name_en = slug_map.get(r["area_name"])
+    def _build_update(r: dict) -> dict:
         scores = score_map.get(r["id"], {})
-        updates.append({
+        return {
             **r,
-            "name_en": name_en,
+            "name_en": slug_map.get(r["area_name"]),
             "score": scores.get("score"),
             "rank": scores.get("rank"),
             "crime_rate": scores.get("crime_rate"),
-        })
+        }
 
     if args.dry_run:
+        updates = [_build_update(r) for r in rows]
         logger.info("[DRY RUN] %d 件の更新をスキップ", len(updates))
         # サンプル表示（スコアあり のみ）
         scored = [u for u in updates if u.get("score") is not None]
@@ -221,15 +206,19 @@ def main(args):
         return
 
     # 6. バッチ UPSERT（全カラム含むため NOT NULL 制約を満たす）
+    #    全カラムの行はページ単位で逐次取得し、全件をメモリに載せない
     client = get_client()
     batch_size = 100
     total = 0
-    for i in range(0, len(updates), batch_size):
-        batch = updates[i : i + batch_size]
-        result = client.table("town_crimes").upsert(batch, on_conflict="id").execute()
-        total += len(result.data) if result.data else 0
-        if (i + batch_size) % 1000 == 0 or i + batch_size >= len(updates):
-            logger.info("  更新進捗: %d / %d", min(i + batch_size, len(updates)), len(updates))
+    processed = 0
+    for page in iter_rows("town_crimes", UPSERT_COLS, batches=True):
+        updates = [_build_update(r) for r in page]
+        for i in range(0, len(updates), batch_size):
+            batch = updates[i : i + batch_size]
+            result = client.table("town_crimes").upsert(batch, on_conflict="id").execute()
+            total += len(result.data) if result.data else 0
+        processed += len(updates)
+        logger.info("  更新進捗: %d / %d", processed, len(rows))
 
     logger.info("完了: %d 件更新", total)
 
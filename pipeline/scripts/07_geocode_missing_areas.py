@@ -18,7 +18,7 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from lib.crime_parser import load_boundaries, _find_parent_union
 from lib.geo_utils import forward_geocode_gsi
-from lib.supabase_client import get_client
+from lib.supabase_client import get_client, select_all
 
 logging.basicConfig(
     level=logging.INFO,
@@ -29,28 +29,12 @@ logger = logging.getLogger(__name__)
 DATA_DIR = Path(__file__).resolve().parent.parent / "data" / "raw"
 DEFAULT_SHP = str(DATA_DIR / "administrative_area" / "tokyo" / "r2ka13.shp")
 
-PAGE_SIZE = 1000
-
 
 def fetch_null_centroid_areas() -> list[dict]:
-    """lat が NULL の town_crimes レコードを取得（各 area_name につき1行のみ）"""
-    client = get_client()
-    rows: list[dict] = []
-    offset = 0
-    while True:
-        page = (
-            client.table("town_crimes")
-            .select("id,area_name,municipality_name,year")
-            .is_("lat", "null")
-            .range(offset, offset + PAGE_SIZE - 1)
-            .execute()
-        )
-        batch = page.data or []
-        rows.extend(batch)
-        if len(batch) < PAGE_SIZE:
-            break
-        offset += PAGE_SIZE
-    return rows
+    """lat が NULL の town_crimes レコードを取得"""
+    return select_all(
+        "town_crimes", "id,area_name,municipality_name,year", filters={"lat": None}
+    )
 
 
 def main(args):
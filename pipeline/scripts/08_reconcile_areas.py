@@ -22,7 +22,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from lib.crime_parser import find_parent_child_matches
-from lib.supabase_client import get_client, select_all, upsert_records
+from lib.supabase_client import get_client, iter_rows, select_all, upsert_records
 
 logging.basicConfig(
     level=logging.INFO,
@@ -33,6 +33,9 @@ logger = logging.getLogger(__name__)
 # town_crimes に存在する年の範囲
 CRIME_YEARS = list(range(2017, 2026))
 
+# areas / town_crimes を読むときの並列ページ数
+FETCH_CONCURRENCY = 4
+
 
 def _compute_centroid(children: list[dict]) -> tuple[float, float] | None:
     """子エリアの lat/lng 重心を計算"""
@@ -200,15 +203,21 @@ def main():
 
     # 1. areas テーブルから全レコード取得
     logger.info("Step 1: areas テーブル取得中...")
-    areas = select_all("areas", "area_name,lat,lng,municipality_code,municipality_name")
+    areas = select_all(
+        "areas",
+        "area_name,lat,lng,municipality_code,municipality_name",
+        concurrency=FETCH_CONCURRENCY,
+    )
     area_names = {a["area_name"] for a in areas}
     areas_by_name = {a["area_name"]: a for a in areas}
     logger.info("areas: %d エリア", len(area_names))
 
     # 2. town_crimes テーブルからユニーク area_name 取得
     logger.info("Step 2: town_crimes テーブル取得中...")
-    crimes = select_all("town_crimes", "area_name")
-    crime_names = {c["area_name"] for c in crimes}
+    crime_names = {
+        c["area_name"]
+        for c in iter_rows("town_crimes", "area_name", concurrency=FETCH_CONCURRENCY)
+    }
     logger.info("town_crimes: %d ユニーク area_name", len(crime_names))
 
     # 3. 集合比較サマリー
@@ -18,7 +18,7 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from lib.supabase_client import get_client, select_all
+from lib.supabase_client import get_client, iter_rows
 
 logging.basicConfig(
     level=logging.INFO,
@@ -63,20 +63,21 @@ def main():
 
     # 1. town_crimes の全 area_name を取得
     logger.info("Step 1: town_crimes からユニーク area_name を取得中...")
-    rows = select_all("town_crimes", "id,area_name")
-    logger.info("town_crimes: %d レコード取得", len(rows))
-
-    # 2. ゴミデータを抽出
+    # 2. 逐次取得しながらゴミデータを抽出
     garbage_ids: list[str] = []
     garbage_by_reason: dict[str, list[str]] = {}
+    total_rows = 0
 
-    for row in rows:
+    for row in iter_rows("town_crimes", "id,area_name"):
+        total_rows += 1
         area_name = row["area_name"]
         reason = _is_garbage(area_name)
         if reason:
             garbage_ids.append(row["id"])
             garbage_by_reason.setdefault(reason, []).append(area_name)
 
+    logger.info("town_crimes: %d レコード取得", total_rows)
+
     if not garbage_ids:
         logger.info("ゴミデータなし。処理終了。")
         return
@@ -9,6 +9,8 @@ e-Stat API の人口総数を投入する。
 Usage:
     python pipeline/scripts/11_backfill_population.py --dry-run
     python pipeline/scripts/11_backfill_population.py
+    python pipeline/scripts/11_backfill_population.py --refresh-estat  # e-Stat キャッシュを取り直す
+    python pipeline/scripts/11_backfill_population.py --verify-estat-filters  # API 側の絞り込みの検証のみ
 """
 
 import argparse
@@ -18,7 +20,11 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from lib.estat_client import fetch_all_estat_area_data
+from lib.estat_client import (
+    clear_estat_cache,
+    fetch_all_estat_area_data,
+    verify_query_filters,
+)
 from lib.supabase_client import get_client, select_all
 from config.settings import ESTAT_API_KEY
 
@@ -130,4 +136,17 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument("--dry-run", action="store_true", help="DB更新せずプレビューのみ")
     parser.add_argument("--force", action="store_true", help="設定済みでも強制更新")
-    main(parser.parse_args())
+    parser.add_argument(
+        "--refresh-estat", action="store_true", help="e-Stat の取得結果キャッシュを削除して再取得"
+    )
+    parser.add_argument(
+        "--verify-estat-filters",
+        action="store_true",
+        help="e-Stat の API 側の絞り込みあり/なしで集計結果が一致するか確認して終了（DB は触らない）",
+    )
+    args = parser.parse_args()
+    if args.verify_estat_filters:
+        sys.exit(0 if verify_query_filters(ESTAT_API_KEY) else 1)
+    if args.refresh_estat:
+        logger.info("e-Stat キャッシュ削除: %d 件", clear_estat_cache())
+    main(args)
@@ -0,0 +1,133 @@
+"""
+Overpass クライアント（バッチモード）のキャッシュ再利用のテスト。
+
+Overpass API は呼ばず、施設をランダムに置いた偽の _query_once で応答する。
+"""
+
+import random
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lib import overpass_client as oc
+from lib.disk_cache import DiskCache
+from lib.spatial_index import haversine_distance_np
+
+_KINDS = [
+    ("amenity", "restaurant"),
+    ("shop", "convenience"),
+    ("leisure", "park"),
+    ("amenity", "school"),
+    ("amenity", "hospital"),
+]
+
+
+class FakeOverpass:
+    """around クエリに、各地点の半径内にある施設（node）を返す偽の Overpass"""
+
+    def __init__(self, n_facilities=3000, seed=0):
+        rng = random.Random(seed)
+        self.elements = []
+        for i in range(n_facilities):
+            key, value = _KINDS[i % len(_KINDS)]
+            self.elements.append({
+                "type": "node",
+                "id": i,
+                "lat": 35.60 + rng.random() * 0.1,
+                "lon": 139.60 + rng.random() * 0.1,
+                "tags": {key: value},
+            })
+        self.lats = np.array([e["lat"] for e in self.elements])
+        self.lngs = np.array([e["lon"] for e in self.elements])
+        self.queried_points = []
+
+    def __call__(self, query, endpoint_idx, timeout=None):
+        radius = int(re.search(r"around:(\d+),", query).group(1))
+        points = sorted(set(re.findall(r"around:\d+,([\d.]+),([\d.]+)\)", query)))
+        mask = np.zeros(len(self.elements), dtype=bool)
+        for lat, lng in points:
+            self.queried_points.append((lat, lng))
+            mask |= haversine_distance_np(self.lats, self.lngs, float(lat), float(lng)) <= radius
+        return {"elements": [self.elements[i] for i in np.flatnonzero(mask)]}, False
+
+
+@pytest.fixture
+def fake(tmp_path, monkeypatch):
+    overpass = FakeOverpass()
+    monkeypatch.setattr(oc, "_query_once", overpass)
+    monkeypatch.setattr(oc, "_facility_cache", DiskCache(tmp_path / "overpass"))
+    monkeypatch.setattr(oc, "_BATCH_STATS_PATH", tmp_path / "overpass_stats.json")
+    monkeypatch.setattr(oc, "_BATCH_DELAY", 0.001)
+    monkeypatch.setattr(oc, "_WORKER_MAX_RATE", 1000)
+    return overpass
+
+
+def _stations(n=60, seed=1):
+    rng = random.Random(seed)
+    return [
+        {"lat": round(35.62 + rng.random() * 0.06, 6), "lng": round(139.62 + rng.random() * 0.06, 6)}
+        for _ in range(n)
+    ]
+
+
+def _fresh_counts(tmp_path, monkeypatch, name, stations, radius_m, count_mode):
+    """空のキャッシュで同じ計画を取得した結果（比較用）"""
+    monkeypatch.setattr(oc, "_facility_cache", DiskCache(tmp_path / name))
+    return oc.fetch_facilities_in_batches(stations, radius_m, count_mode)
+
+
+@pytest.mark.parametrize("count_mode", oc.COUNT_MODES)
+def test_batch_cache_reused_when_batch_sizes_change(fake, tmp_path, monkeypatch, count_mode):
+    stations = _stations()
+    monkeypatch.setattr(oc, "_BATCH_SIZE", 10)
+    monkeypatch.setattr(oc, "_load_batch_stats", lambda: {})
+    oc.fetch_facilities_in_batches(stations, 500, count_mode)
+    assert len(fake.queried_points) == len(stations)
+
+    # セルごとのバッチサイズが変わった計画でも、全地点がキャッシュから集計される
+    fake.queried_points.clear()
+    monkeypatch.setattr(oc, "_BATCH_SIZE", 3)
+    cached = oc.fetch_facilities_in_batches(stations, 500, count_mode)
+    assert fake.queried_points == []
+
+    assert cached == _fresh_counts(tmp_path, monkeypatch, "fresh", stations, 500, count_mode)
+
+
+@pytest.mark.parametrize("count_mode", oc.COUNT_MODES)
+def test_batch_cache_reused_for_smaller_radius(fake, tmp_path, monkeypatch, count_mode):
+    stations = _stations()
+    # 大きい半径には前回までに調整されたバッチサイズがある
+    cells = {cell for cell, _ in oc._plan_batches(stations, {})}
+    oc._save_batch_stats({"800": {"cells": {cell: {"batch_size": 4} for cell in cells}}})
+    oc.fetch_facilities_in_batches(stations, 800, count_mode)
+
+    # そのキャッシュを、統計のない半径（既定のバッチサイズ）の計画で使い回す
+    fake.queried_points.clear()
+    cached = oc.fetch_facilities_in_batches(stations, 500, count_mode)
+    assert fake.queried_points == []
+
+    assert cached == _fresh_counts(tmp_path, monkeypatch, "fresh", stations, 500, count_mode)
+
+
+def test_batch_cache_queries_only_missing_points(fake):
+    stations = _stations()
+    oc.fetch_facilities_in_batches(stations[:40], 500)
+
+    fake.queried_points.clear()
+    oc.fetch_facilities_in_batches(stations, 500)
+    expected = {(f"{s['lat']}", f"{s['lng']}") for s in stations[40:]}
+    assert set(fake.queried_points) == expected
+
+
+def test_batch_cache_refetches_for_larger_radius(fake):
+    stations = _stations(n=10)
+    oc.fetch_facilities_in_batches(stations, 500)
+
+    fake.queried_points.clear()
+    oc.fetch_facilities_in_batches(stations, 800)
+    assert len(fake.queried_points) == len(stations)